@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""Measures the CPU use and admission rate of the pilot worker's
+scheduling loop.
+
+The script queues NUM_TASKS short tasks ('/bin/true') in the 'ready to
+execute' queue and then starts the LOCALHOST backend's worker with CORES
+slots on them, without any file staging. It reports
+
+  * the admission rate: tasks submitted as CUs per second
+  * the throughput: tasks completed per second
+  * the CPU use of the worker process (without the CUs) while it works
+    through the queue and while it is idle afterwards
+
+Usage: pilot_worker_loop.py [NUM_TASKS] [CORES]
+
+NUM_TASKS defaults to 10000, CORES to 64. Linux only (the CPU time of the
+worker is read from /proc).
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+import bigjobasync
+
+from bigjobasync.task_spec     import _TaskSpec
+from bigjobasync.task_queue    import _TaskQueueManager
+from bigjobasync.local_worker  import _LocalWorker
+from bigjobasync.state_channel import _StateChannel
+
+# seconds the worker is left idle after the last task
+IDLE_PERIOD = 5
+
+# ----------------------------------------------------------------------------
+#
+def cpu_seconds(pid):
+    """Returns the user + system CPU time of process 'pid' (without its
+    children).
+    """
+    with open("/proc/%d/stat" % pid) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return float(int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+# ----------------------------------------------------------------------------
+#
+def create_spec(i, remote_workdir_url):
+    uid = uuid.uuid4()
+    name = "task-%d" % i
+    return _TaskSpec(
+        uid=uid,
+        name=name,
+        dir_name="%s__%s" % (name, uid),
+        remote_workdir_url=remote_workdir_url,
+        executable="/bin/true",
+        arguments=[],
+        environment={},
+        cores=1,
+        input=(),
+        output=(),
+        priority=0,
+        group=None,
+        workdir_created=False,
+        state=bigjobasync.WAITING_FOR_EXECUTION)
+
+# ----------------------------------------------------------------------------
+#
+def watch_admissions(channel, admitted):
+    """Records the time at which each task became PENDING, i.e., was
+    submitted as a CU.
+    """
+    while True:
+        uid, state, timestamp, _ = channel.get()
+        if state == bigjobasync.PENDING:
+            admitted.append(timestamp)
+
+# ----------------------------------------------------------------------------
+#
+if __name__ == "__main__":
+
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cores     = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    workdir = tempfile.mkdtemp(prefix="bja-bench-")
+    remote_workdir_url = "file://localhost/%s/" % workdir
+
+    resource_obj = {
+        'log'               : [],
+        'callbacks'         : [],
+        'state'             : bigjobasync.NEW,
+        'workdir'           : workdir,
+        'remote_workdir_url': remote_workdir_url,
+        'runtime'           : 60,
+        'cores'             : cores,
+    }
+
+    manager = _TaskQueueManager()
+    manager.start()
+
+    ready_to_exec_q            = manager.TaskQueue(False)
+    ready_to_transfer_input_q  = manager.TaskQueue(False)
+    ready_to_transfer_output_q = manager.TaskQueue(False)
+    done_q        = multiprocessing.JoinableQueue()
+    failed_q      = multiprocessing.JoinableQueue()
+    state_channel = _StateChannel()
+
+    admitted = []
+    watcher = threading.Thread(target=watch_admissions, args=(state_channel, admitted))
+    watcher.daemon = True
+    watcher.start()
+
+    print "Queueing %d tasks" % num_tasks
+    for i in range(num_tasks):
+        ready_to_exec_q.put(create_spec(i, remote_workdir_url))
+
+    worker = _LocalWorker(resource_obj, ready_to_transfer_input_q,
+        ready_to_exec_q, ready_to_transfer_output_q, done_q, failed_q,
+        state_channel)
+
+    try:
+        start = time.time()
+        worker.start()
+
+        finished = 0
+        failed   = 0
+        while finished < num_tasks:
+            try:
+                done_q.get(True, 0.1)
+            except Exception:
+                try:
+                    failed_q.get_nowait()
+                    failed += 1
+                except Exception:
+                    continue
+            finished += 1
+        busy_elapsed = time.time() - start
+        busy_cpu     = cpu_seconds(worker.pid)
+
+        time.sleep(IDLE_PERIOD)
+        idle_cpu = cpu_seconds(worker.pid) - busy_cpu
+
+        # let the watcher catch up
+        time.sleep(1)
+
+        print ""
+        print "Tasks:              %d (%d failed), %d cores" % (num_tasks, failed, cores)
+        if len(admitted) > 1:
+            print "Admission rate:     %.0f tasks/s (%d admitted)" \
+                % (len(admitted) / (max(admitted) - start), len(admitted))
+        print "Throughput:         %.0f tasks/s (%.1fs)" % (num_tasks / busy_elapsed, busy_elapsed)
+        print "Worker CPU (busy):  %.1fs (%.0f%% of one core)" \
+            % (busy_cpu, 100.0 * busy_cpu / busy_elapsed)
+        print "Worker CPU (idle):  %.2fs in %ds (%.1f%% of one core)" \
+            % (idle_cpu, IDLE_PERIOD, 100.0 * idle_cpu / IDLE_PERIOD)
+
+    finally:
+        worker.stop()
+        worker.join(10)
+        if worker.is_alive():
+            worker.terminate()
+        manager.shutdown()
+        shutil.rmtree(workdir)
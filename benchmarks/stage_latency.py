@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+"""Measures the end-to-end latency of short tasks on the LOCALHOST
+backend.
+
+Each task copies one small LOCAL input file into its working directory,
+runs '/bin/cat' on it and transfers its output file back. The tasks run
+one at a time, i.e., the next task is only scheduled when the previous
+one is DONE, so that every task goes through empty stages and the time
+measured is the handoff latency of the stages, not queueing. It reports
+the latency from schedule_tasks() to DONE as well as the time spent in
+each stage, taken from the task state callbacks:
+
+  * input:     scheduled -> WAITING_FOR_EXECUTION
+  * execution: WAITING_FOR_EXECUTION -> TRANSFERRING_OUTPUT
+  * output:    TRANSFERRING_OUTPUT -> DONE
+
+To measure the effect of a change, run the script on the tree before
+and after it, e.g., before and after the blocking transfer worker loops
+(0.3).
+
+Usage: stage_latency.py [NUM_TASKS]
+
+NUM_TASKS defaults to 50. Needs saga-python, but no remote resource.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+import bigjobasync
+
+# ----------------------------------------------------------------------------
+#
+class TaskTimer(object):
+    """Task callback that records when the task entered each state and
+    signals when it has reached a final state.
+    """
+    def __init__(self):
+        self.timestamps = {}
+        self.finished   = threading.Event()
+
+    def __call__(self, origin, old_state, new_state):
+        self.timestamps[new_state] = time.time()
+        if new_state in [bigjobasync.DONE, bigjobasync.FAILED]:
+            self.finished.set()
+
+# ----------------------------------------------------------------------------
+#
+def resource_cb(origin, old_state, new_state):
+    """Aborts the benchmark if the resource fails.
+    """
+    if new_state == bigjobasync.FAILED:
+        for entry in origin.log:
+            print "   * LOG: %s" % entry
+        sys.stderr.write("Resource failed. EXITING.\n")
+        sys.exit(-1)
+
+# ----------------------------------------------------------------------------
+#
+def create_task(i, input_file, output_dir):
+    return bigjobasync.Task(
+        name        = "latency-task-%s" % i,
+        cores       = 1,
+        executable  = "/bin/bash",
+        arguments   = ["-c", "\"/bin/cat input.txt > output.txt\""],
+        input = [
+            {
+                "mode"        : bigjobasync.COPY,
+                "origin"      : bigjobasync.LOCAL,
+                "origin_path" : input_file,
+            }
+        ],
+        output = [
+            {
+                "mode"             : bigjobasync.COPY,
+                "origin_path"      : "output.txt",
+                "destination"      : bigjobasync.LOCAL,
+                "destination_path" : os.path.join(output_dir, "output-%s.txt" % i),
+            }
+        ]
+    )
+
+# ----------------------------------------------------------------------------
+#
+def summary(values):
+    """Returns (median, mean, 95th percentile) of 'values' in ms.
+    """
+    values = sorted(values)
+    median = values[len(values) / 2]
+    mean   = sum(values) / len(values)
+    p95    = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return median * 1000, mean * 1000, p95 * 1000
+
+# ----------------------------------------------------------------------------
+#
+if __name__ == "__main__":
+
+    num_tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    tmp_dir    = tempfile.mkdtemp(prefix="bja-bench-")
+    workdir    = os.path.join(tmp_dir, "workdir")
+    output_dir = os.path.join(tmp_dir, "output")
+    input_file = os.path.join(tmp_dir, "input.txt")
+    os.mkdir(workdir)
+    os.mkdir(output_dir)
+    with open(input_file, "w") as f:
+        f.write("Lorem ipsum dolor sit amet.\n")
+
+    localhost = bigjobasync.Resource(
+        name     = "localhost",
+        resource = bigjobasync.RESOURCES['LOCALHOST'],
+        runtime  = 60,
+        cores    = 1,
+        workdir  = workdir,
+        backend  = bigjobasync.LOCALHOST
+    )
+    localhost.register_callbacks(resource_cb)
+    localhost.allocate(terminate_on_empty_queue=True)
+
+    stages = {"input": [], "execution": [], "output": []}
+    total  = []
+    failed = 0
+
+    try:
+        print "Running %d tasks one at a time" % num_tasks
+        for i in range(num_tasks):
+            task  = create_task(i, input_file, output_dir)
+            timer = TaskTimer()
+            task.register_callbacks(timer)
+
+            scheduled = time.time()
+            localhost.schedule_tasks([task])
+            timer.finished.wait()
+
+            ts = timer.timestamps
+            if bigjobasync.DONE not in ts:
+                failed += 1
+                continue
+
+            total.append(ts[bigjobasync.DONE] - scheduled)
+            stages["input"].append(ts[bigjobasync.WAITING_FOR_EXECUTION] - scheduled)
+            stages["execution"].append(ts[bigjobasync.TRANSFERRING_OUTPUT] - ts[bigjobasync.WAITING_FOR_EXECUTION])
+            stages["output"].append(ts[bigjobasync.DONE] - ts[bigjobasync.TRANSFERRING_OUTPUT])
+
+        localhost.wait()
+
+        print ""
+        print "Tasks: %d (%d failed)" % (num_tasks, failed)
+        if len(total) > 0:
+            print "%-12s %10s %10s %10s" % ("latency", "median ms", "mean ms", "p95 ms")
+            for name in ["input", "execution", "output"]:
+                print "%-12s %10.0f %10.0f %10.0f" % ((name,) + summary(stages[name]))
+            print "%-12s %10.0f %10.0f %10.0f" % (("end-to-end",) + summary(total))
+
+    finally:
+        localhost.stop()
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""Measures the cost of moving tasks between the stages.
+
+Before 0.3, every hop between the Resource and the workers pickled the
+whole Task object, including its log. Now only a _TaskSpec travels. This
+script compares both formats:
+
+  * bytes per hop: size of one pickled task
+  * hops per second (serialization): pickle + unpickle only
+  * hops per second (queue): put + get through a _TaskQueue hosted by a
+    _TaskQueueManager, i.e., the inter-stage queues that the workers use
+
+Usage: task_wire_format.py [NUM_TASKS] [LOG_ENTRIES]
+
+NUM_TASKS defaults to 100000, LOG_ENTRIES (the length of the task log
+when the Task object is pickled) to 20. Needs no resource or network.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import sys
+import time
+import cPickle
+
+import bigjobasync
+
+from bigjobasync.task_spec  import _TaskSpec
+from bigjobasync.task_queue import _TaskQueueManager
+
+# ----------------------------------------------------------------------------
+#
+def task_cb(origin, old_state, new_state):
+    pass
+
+# ----------------------------------------------------------------------------
+#
+def create_tasks(num_tasks, log_entries):
+    """Creates tasks that look like the ones in the examples, with a log
+    of 'log_entries' entries.
+    """
+    tasks = []
+    for i in range(num_tasks):
+        task = bigjobasync.Task(
+            name="combinator-task-%s" % i,
+            cores=1,
+            executable="/bin/bash",
+            arguments=["-c", "\"cat loreipsum_pt1.txt loreipsum_pt2.txt >> STDOUT\""],
+            input=[
+                {
+                    "mode"        : bigjobasync.COPY,
+                    "origin"      : bigjobasync.LOCAL,
+                    "origin_path" : "/home/user/loreipsum_pt1.txt",
+                },
+                {
+                    "mode"        : bigjobasync.COPY,
+                    "origin"      : bigjobasync.LOCAL,
+                    "origin_path" : "/home/user/loreipsum_pt2.txt",
+                },
+            ],
+            output=[
+                {
+                    "mode"             : bigjobasync.COPY,
+                    "origin_path"      : "STDOUT",
+                    "destination"      : bigjobasync.LOCAL,
+                    "destination_path" : "STDOUT-from-task-%s" % i,
+                    "trasfer_if_failed": True
+                }
+            ]
+        )
+        task.register_callbacks(task_cb)
+        task._remote_workdir_url = "sftp://stampede.tacc.utexas.edu//scratch/00988/tg802352/example/"
+        for j in range(log_entries):
+            task._log.append("Copying output file sftp://stampede.tacc.utexas.edu//scratch/00988/tg802352/example/%s/STDOUT to file://localhost//home/user/STDOUT-from-task-%s" % (task.dir_name, i))
+        tasks.append(task)
+    return tasks
+
+# ----------------------------------------------------------------------------
+#
+def measure_serialization(items):
+    """Returns (average bytes, hops per second) for pickling and
+    unpickling 'items' once each.
+    """
+    total = 0
+    start = time.time()
+    for item in items:
+        data = cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+        cPickle.loads(data)
+        total += len(data)
+    elapsed = time.time() - start
+    return float(total) / len(items), len(items) / elapsed
+
+# ----------------------------------------------------------------------------
+#
+def measure_queue(manager, items):
+    """Returns the hops per second for putting 'items' into a _TaskQueue
+    and getting them out again.
+    """
+    queue = manager.TaskQueue(False)
+    start = time.time()
+    for item in items:
+        queue.put(item)
+    for item in items:
+        queue.get()
+        queue.task_done()
+    elapsed = time.time() - start
+    return len(items) / elapsed
+
+# ----------------------------------------------------------------------------
+#
+if __name__ == "__main__":
+
+    num_tasks   = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    log_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    print "Creating %d tasks with %d log entries each" % (num_tasks, log_entries)
+    tasks = create_tasks(num_tasks, log_entries)
+    specs = [_TaskSpec.from_task(task) for task in tasks]
+
+    manager = _TaskQueueManager()
+    manager.start()
+
+    try:
+        print ""
+        print "%-12s %14s %22s %16s" % ("format", "bytes/hop", "hops/s (serialization)", "hops/s (queue)")
+        for name, items in [("Task", tasks), ("_TaskSpec", specs)]:
+            size, serialization_rate = measure_serialization(items)
+            queue_rate = measure_queue(manager, items)
+            print "%-12s %14.0f %22.0f %16.0f" % (name, size, serialization_rate, queue_rate)
+    finally:
+        manager.shutdown()
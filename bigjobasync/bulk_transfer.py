@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""Implements glob and recursive directory directives. All files a
+directive refers to are listed once and transferred as one archive (or
+with one remote command), not file by file.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import re
+import glob
+import uuid
+import errno
+import saga
+import pipes
+import tarfile
+import tempfile
+import constants
+
+# characters that may appear in a glob pattern that is expanded by the
+# remote shell
+_SAFE_PATTERN = re.compile(r'^[A-Za-z0-9_.,+=@%:\-*?\[\]]+$')
+
+# ----------------------------------------------------------------------------
+#
+def _has_glob(path):
+    return any([c in os.path.basename(path) for c in '*?['])
+
+# ----------------------------------------------------------------------------
+#
+def _shell_pattern(path):
+    """Returns 'path' for use in a shell command: quoted, except for the
+    glob characters in its last component.
+    """
+    if not _has_glob(path):
+        return pipes.quote(path)
+
+    dirname, pattern = os.path.split(path)
+    if not _SAFE_PATTERN.match(pattern):
+        raise saga.exceptions.BadParameter("Unsupported characters in glob pattern '%s'." % pattern)
+    if dirname == '':
+        return pattern
+    return "%s/%s" % (pipes.quote(dirname), pattern)
+
+# ----------------------------------------------------------------------------
+#
+def _expand(path):
+    """Returns the shell commands that expand 'path' into "$@" and fail if
+    nothing matches, followed by a command that prints the number of files
+    and their total size.
+    """
+    # 'ls -lnL' instead of 'find -printf', which is GNU only
+    return ("set -- %s && { test -e \"$1\" || { echo \"No such file or directory: %s\"; exit 1; }; } && "
+            "find -L \"$@\" -type f -exec ls -lnL {} + | awk '{n++; s+=$5} END {print n+0, s+0}'") \
+        % (_shell_pattern(path), path.replace('"', ''))
+
+# ----------------------------------------------------------------------------
+#
+def _local_totals(path):
+    """Returns (files, bytes) of a local file or directory tree.
+    """
+    if not os.path.isdir(path):
+        return 1, os.path.getsize(path)
+
+    files, size = 0, 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            files += 1
+            size  += os.path.getsize(os.path.join(dirpath, filename))
+    return files, size
+
+# ----------------------------------------------------------------------------
+#
+def _parse_totals(out):
+    """Returns (files, bytes) from the output of the _expand() commands.
+    """
+    for line in reversed(out.strip().splitlines()):
+        fields = line.split()
+        if len(fields) == 2 and fields[0].isdigit() and fields[1].isdigit():
+            return int(fields[0]), int(fields[1])
+    return 0, 0
+
+
+# ----------------------------------------------------------------------------
+#
+class _BulkTransfer(object):
+    """Transfers the files that a glob pattern (in the last component of
+    'origin_path') or a directory ('recursive': True) refers to. Local
+    files are packed into one tar archive, remote files are handled by
+    one remote command per directive.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, fs_pool, shells):
+        self._fs_pool = fs_pool
+        self._shells  = shells
+
+    # ------------------------------------------------------------------------
+    #
+    @staticmethod
+    def applies_to(directive):
+        """Returns True if 'directive' is a glob or recursive directive.
+        """
+        return directive.get('recursive') is True or _has_glob(directive['origin_path'])
+
+    # ------------------------------------------------------------------------
+    #
+    def upload(self, local_path, task_workdir_url, log):
+        """Copies the local files that 'local_path' refers to into the
+        task's working directory.
+        """
+        if _has_glob(local_path):
+            paths = sorted(glob.glob(local_path))
+        elif os.path.isdir(local_path):
+            paths = [local_path]
+        else:
+            paths = []
+        if len(paths) == 0:
+            raise IOError(errno.ENOENT, "No such file or directory", local_path)
+
+        files, size = 0, 0
+        fd, archive_path = tempfile.mkstemp(prefix="bja-", suffix=".tar")
+        try:
+            with os.fdopen(fd, 'wb') as archive_file:
+                tar = tarfile.open(fileobj=archive_file, mode='w|')
+                for path in paths:
+                    tar.add(path, arcname=os.path.basename(path.rstrip('/')))
+                    path_files, path_size = _local_totals(path)
+                    files += path_files
+                    size  += path_size
+                tar.close()
+
+            task_workdir_path = saga.Url(task_workdir_url).path
+            remote_archive    = "%s/.%s" % (task_workdir_path, os.path.basename(archive_path))
+
+            with self._fs_pool.directory(task_workdir_url) as root:
+                root.copy("file://localhost//%s" % archive_path, remote_archive)
+
+            # always remove the archive, but report tar's exit code
+            self._shells.get(task_workdir_url).run(
+                "(cd %s && tar xf %s); rc=$?; rm -f %s; test $rc -eq 0" \
+                % (pipes.quote(task_workdir_path), pipes.quote(remote_archive), pipes.quote(remote_archive)))
+        finally:
+            os.remove(archive_path)
+
+        log.append("Copied LOCAL input '%s': %d files, %d bytes" % (local_path, files, size))
+
+    # ------------------------------------------------------------------------
+    #
+    def remote(self, source, task_workdir_url, target, mode, log):
+        """Copies or links the remote files that 'source' refers to into
+        the directory 'target'. Relative paths are resolved against the
+        task's working directory.
+        """
+        if mode == constants.COPY:
+            cmd = "cp -rf \"$@\" %s" % pipes.quote(target)
+        else:
+            cmd = "ln -sfn \"$@\" %s" % pipes.quote(target)
+
+        out = self._shells.get(task_workdir_url).run("(cd %s && %s && mkdir -p %s && %s)" % (
+            pipes.quote(saga.Url(task_workdir_url).path), _expand(source), pipes.quote(target), cmd))
+        files, size = _parse_totals(out)
+
+        if target == '.':
+            target = "the task's working directory"
+        log.append("%s REMOTE '%s' to %s: %d files, %d bytes" % (
+            'Copied' if mode == constants.COPY else 'Linked', source, target, files, size))
+
+    # ------------------------------------------------------------------------
+    #
+    def download(self, origin_path, task_workdir_url, local_dir, log):
+        """Copies the files that 'origin_path' (relative to the task's
+        working directory) refers to into 'local_dir'.
+        """
+        task_workdir_path = saga.Url(task_workdir_url).path
+        remote_archive    = "%s/.bja-%s.tar.gz" % (task_workdir_path, uuid.uuid4())
+        shell             = self._shells.get(task_workdir_url)
+
+        # Every match is added under its basename (tar -C <absolute
+        # dirname> <basename>), so that the files end up directly in 'local_dir',
+        # like upload() and remote() do. The archive itself is excluded, in
+        # case it is inside a directory that is archived.
+        out = shell.run("(cd %s && %s && n=$# && for m in \"$@\"; do set -- \"$@\" -C \"$(cd \"$(dirname \"$m\")\" && pwd)\" \"$(basename \"$m\")\"; done && shift $n && tar czf %s --exclude %s \"$@\")" % (
+            pipes.quote(task_workdir_path), _expand(origin_path), pipes.quote(remote_archive),
+            pipes.quote(os.path.basename(remote_archive))))
+        files, size = _parse_totals(out)
+
+        fd, archive_path = tempfile.mkstemp(prefix="bja-", suffix=".tar.gz")
+        os.close(fd)
+        try:
+            with self._fs_pool.directory(task_workdir_url) as root:
+                root.copy(remote_archive, "file://localhost//%s" % archive_path)
+            transferred = os.path.getsize(archive_path)
+
+            if not os.path.isdir(local_dir):
+                os.makedirs(local_dir)
+            tar = tarfile.open(archive_path, 'r:gz')
+            try:
+                tar.extractall(local_dir)
+            finally:
+                tar.close()
+        finally:
+            os.remove(archive_path)
+            shell.run("rm -f %s" % pipes.quote(remote_archive))
+
+        log.append("Copied output '%s' to %s: %d files, %d bytes (%d bytes transferred)" \
+            % (origin_path, local_dir, files, size, transferred))
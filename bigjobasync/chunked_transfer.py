@@ -0,0 +1,243 @@
+#!/usr/bin/env python
+
+"""Implements parallel, resumable transfers of large files. Files are
+split into chunks that are transferred over several concurrent streams
+and reassembled on the other side.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import saga
+import pipes
+import shutil
+import hashlib
+import tempfile
+import constants
+
+from multiprocessing.pool import ThreadPool
+
+from retry             import _TransientError
+from logger            import logger
+from transfer_manifest import _file_sha1
+
+# name of the file in a parts directory that holds the size and mtime of
+# the file that has been split
+_STAMP = ".source"
+
+# ----------------------------------------------------------------------------
+#
+def _parts_dir(path):
+    """Returns the name of the directory that holds the chunks of 'path'.
+    """
+    return os.path.join(os.path.dirname(path), ".%s.parts" % os.path.basename(path))
+
+# ----------------------------------------------------------------------------
+#
+def _part_name(index):
+    return "part.%06d" % index
+
+
+# ----------------------------------------------------------------------------
+#
+class _ChunkedTransfer(object):
+    """Transfers files in chunks of CHUNKED_TRANSFER_CHUNK_SIZE bytes over
+    CHUNKED_TRANSFER_STREAMS concurrent streams. Every stream uses its own
+    directory handle from the pool.
+
+    Chunks are verified (SHA-1) after the transfer and retried up to
+    CHUNKED_TRANSFER_RETRIES times. Verified chunks are kept until the
+    file has been reassembled, so a failed transfer of the same file
+    resumes where it stopped.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, fs_pool, shells):
+        self._fs_pool = fs_pool
+        self._shells  = shells
+
+    # ------------------------------------------------------------------------
+    #
+    @staticmethod
+    def applies_to(size):
+        """Returns True if a file of 'size' bytes should be transferred in
+        chunks.
+        """
+        threshold = constants.CHUNKED_TRANSFER_THRESHOLD
+        return threshold is not None and size >= threshold
+
+    # ------------------------------------------------------------------------
+    #
+    def upload(self, local_path, remote_url, log):
+        """Uploads 'local_path' to the file 'remote_url'.
+        """
+        size        = os.path.getsize(local_path)
+        chunk_size  = constants.CHUNKED_TRANSFER_CHUNK_SIZE
+        num_chunks  = max(1, (size + chunk_size - 1) / chunk_size)
+        remote_path = saga.Url(remote_url).path
+        parts_dir   = _parts_dir(remote_path)
+        shell       = self._shells.get(remote_url)
+
+        shell.run("mkdir -p %s" % pipes.quote(parts_dir))
+        remote_sums = self._remote_sums(shell, parts_dir)
+
+        todo = []
+        for index in range(num_chunks):
+            remote_sum = remote_sums.pop(_part_name(index), None)
+            if remote_sum is None or remote_sum != self._local_chunk_sha1(local_path, index):
+                todo.append(index)
+
+        # chunks left over from an earlier version of the file
+        if len(remote_sums) > 0:
+            shell.run("cd %s && rm -f %s" % (pipes.quote(parts_dir), " ".join(remote_sums.keys())))
+
+        log.append("Uploading '%s' in %d chunks (%d already on the remote side)" \
+            % (local_path, num_chunks, num_chunks - len(todo)))
+
+        def upload_chunk(index):
+            part_path = "%s/%s" % (parts_dir, _part_name(index))
+            fd, chunk_path = tempfile.mkstemp(prefix="bja-chunk-")
+            try:
+                with os.fdopen(fd, 'wb') as chunk_file:
+                    sha1 = self._copy_range(local_path, index, chunk_file)
+
+                for attempt in range(constants.CHUNKED_TRANSFER_RETRIES):
+                    try:
+                        with self._fs_pool.directory(remote_url) as root:
+                            root.copy("file://localhost//%s" % chunk_path, part_path)
+                        if self._remote_sums(shell, parts_dir, _part_name(index)).get(_part_name(index)) == sha1:
+                            return
+                        logger.warning("Checksum mismatch for chunk %d of '%s'" % (index, local_path))
+                    except Exception, ex:
+                        logger.warning("Transfer of chunk %d of '%s' failed: %s" % (index, local_path, str(ex)))
+                raise _TransientError("Couldn't transfer chunk %d of '%s'." % (index, local_path))
+            finally:
+                os.remove(chunk_path)
+
+        self._run_parallel(upload_chunk, todo)
+
+        # reassemble on the remote side
+        tmp_path = "%s.tmp" % parts_dir
+        shell.run("cat %s/part.* > %s && mv %s %s && rm -rf %s" % (
+            pipes.quote(parts_dir), pipes.quote(tmp_path), pipes.quote(tmp_path),
+            pipes.quote(remote_path), pipes.quote(parts_dir)))
+
+    # ------------------------------------------------------------------------
+    #
+    def download(self, remote_url, local_path, log):
+        """Downloads the file 'remote_url' to 'local_path'.
+        """
+        chunk_size  = constants.CHUNKED_TRANSFER_CHUNK_SIZE
+        remote_path = saga.Url(remote_url).path
+        parts_dir   = _parts_dir(remote_path)
+        local_parts = _parts_dir(local_path)
+        shell       = self._shells.get(remote_url)
+
+        # split on the remote side. the chunks are created in a temporary
+        # directory, so that an interrupted split isn't mistaken for a
+        # complete one. chunks of an earlier split are only reused if the
+        # file still has the same size and mtime.
+        stamp = "%d %d" % shell.stat(pipes.quote(remote_path))
+        if shell.run("cat %s/%s 2>/dev/null || true" % (pipes.quote(parts_dir), _STAMP)).strip() != stamp:
+            tmp_dir = "%s.tmp" % parts_dir
+            shell.run("rm -rf %s %s && mkdir -p %s && split -a 6 -d -b %d %s %s/part. && echo %s > %s/%s && mv %s %s" % (
+                pipes.quote(parts_dir), pipes.quote(tmp_dir), pipes.quote(tmp_dir),
+                chunk_size, pipes.quote(remote_path), pipes.quote(tmp_dir),
+                pipes.quote(stamp), pipes.quote(tmp_dir), _STAMP,
+                pipes.quote(tmp_dir), pipes.quote(parts_dir)))
+        remote_sums = self._remote_sums(shell, parts_dir)
+        if len(remote_sums) == 0:
+            raise Exception("Couldn't split '%s' into chunks." % remote_path)
+
+        if not os.path.isdir(local_parts):
+            os.makedirs(local_parts)
+
+        todo = []
+        for part, sha1 in sorted(remote_sums.items()):
+            local_part = os.path.join(local_parts, part)
+            if not os.path.exists(local_part) or _file_sha1(local_part) != sha1:
+                todo.append(part)
+
+        log.append("Downloading '%s' in %d chunks (%d already on the local side)" \
+            % (remote_path, len(remote_sums), len(remote_sums) - len(todo)))
+
+        def download_chunk(part):
+            local_part = os.path.join(local_parts, part)
+            for attempt in range(constants.CHUNKED_TRANSFER_RETRIES):
+                try:
+                    with self._fs_pool.directory(remote_url) as root:
+                        root.copy("%s/%s" % (parts_dir, part), "file://localhost//%s" % local_part)
+                    if _file_sha1(local_part) == remote_sums[part]:
+                        return
+                    logger.warning("Checksum mismatch for %s of '%s'" % (part, remote_path))
+                except Exception, ex:
+                    logger.warning("Transfer of %s of '%s' failed: %s" % (part, remote_path, str(ex)))
+            raise _TransientError("Couldn't transfer %s of '%s'." % (part, remote_path))
+
+        self._run_parallel(download_chunk, todo)
+
+        # reassemble on the local side
+        tmp_path = "%s.tmp" % local_parts
+        with open(tmp_path, 'wb') as f:
+            for part in sorted(remote_sums.keys()):
+                with open(os.path.join(local_parts, part), 'rb') as part_file:
+                    shutil.copyfileobj(part_file, f)
+        os.rename(tmp_path, local_path)
+        shutil.rmtree(local_parts)
+
+        shell.run("rm -rf %s" % pipes.quote(parts_dir))
+
+    # ------------------------------------------------------------------------
+    #
+    def _run_parallel(self, func, items):
+        if len(items) == 0:
+            return
+        pool = ThreadPool(min(constants.CHUNKED_TRANSFER_STREAMS, len(items)))
+        try:
+            # map() re-raises the first exception
+            pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    # ------------------------------------------------------------------------
+    #
+    def _remote_sums(self, shell, parts_dir, pattern="part.*"):
+        """Returns {chunk name: SHA-1} for the chunks in 'parts_dir'.
+        """
+        out = shell.run("cd %s && (sha1sum %s 2>/dev/null || true)" % (pipes.quote(parts_dir), pattern))
+        sums = {}
+        for line in out.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                sums[fields[1]] = fields[0]
+        return sums
+
+    # ------------------------------------------------------------------------
+    #
+    def _copy_range(self, path, index, target):
+        """Copies chunk 'index' of 'path' into the file object 'target' and
+        returns its SHA-1.
+        """
+        sha1      = hashlib.sha1()
+        remaining = constants.CHUNKED_TRANSFER_CHUNK_SIZE
+        with open(path, 'rb') as f:
+            f.seek(index * constants.CHUNKED_TRANSFER_CHUNK_SIZE)
+            while remaining > 0:
+                block = f.read(min(remaining, 1024*1024))
+                if not block:
+                    break
+                sha1.update(block)
+                if target is not None:
+                    target.write(block)
+                remaining -= len(block)
+        return sha1.hexdigest()
+
+    # ------------------------------------------------------------------------
+    #
+    def _local_chunk_sha1(self, path, index):
+        return self._copy_range(path, index, None)
@@ -9,14 +9,128 @@ __copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
 __license__   = "MIT"
 
 # ----------------------------------------------------------------------------
-# MULTIPROCESSING SETTINGS
-MAX_INPUT_TRANSFER_WORKERS  = 4
-MAX_OUTPUT_TRANSFER_WORKERS = 4
+# MULTIPROCESSING SETTINGS. THE TRANSFER WORKER POOLS START WITH THE FIRST TASK
+# AND SCALE BETWEEN MIN_* AND MAX_* WORKERS.
+MIN_INPUT_TRANSFER_WORKERS  = 1
+MAX_INPUT_TRANSFER_WORKERS  = 8
+MIN_OUTPUT_TRANSFER_WORKERS = 1
+MAX_OUTPUT_TRANSFER_WORKERS = 8
+
+# THE POOLS CHECK QUEUE DEPTH AND THROUGHPUT EVERY AUTOSCALE_INTERVAL SECONDS
+# AND START AS MANY WORKERS AS NEEDED TO DRAIN THE QUEUE WITHIN
+# AUTOSCALE_TARGET_LATENCY SECONDS. WORKERS THAT HAVE NOT BEEN NEEDED FOR
+# AUTOSCALE_IDLE_TIMEOUT SECONDS ARE RETIRED.
+AUTOSCALE_INTERVAL          = 1
+AUTOSCALE_TARGET_LATENCY    = 10
+AUTOSCALE_IDLE_TIMEOUT      = 30
+
+# TRANSFER ENGINES. PROCESS_POOL USES THE (AUTOSCALING) TRANSFER WORKER
+# PROCESSES ABOVE. THREAD_POOL RUNS UP TO TRANSFER_ENGINE_THREADS TRANSFERS
+# CONCURRENTLY IN ONE PROCESS, WITH AT MOST TRANSFER_ENGINE_HOST_LIMIT
+# CONCURRENT OPERATIONS PER REMOTE HOST.
+PROCESS_POOL                = 'ProcessPool'
+THREAD_POOL                 = 'ThreadPool'
+TRANSFER_ENGINE_THREADS     = 64
+TRANSFER_ENGINE_HOST_LIMIT  = 16
+
+# TIMEOUT (IN SECONDS) AFTER WHICH A TRANSFER WORKER WAITING FOR A TASK WAKES
+# UP TO CHECK WHETHER IT HAS BEEN STOPPED
+TRANSFER_WORKER_TIMEOUT     = 5
+
+# ----------------------------------------------------------------------------
+# POOLED SAGA DIRECTORY HANDLES (ONE POOL PER TRANSFER WORKER). IDLE HANDLES
+# ARE CHECKED BEFORE REUSE IF THEY HAVEN'T BEEN USED FOR
+# FS_POOL_HEALTH_CHECK_AFTER SECONDS AND CLOSED AFTER FS_POOL_IDLE_TIMEOUT
+# SECONDS. AT MOST FS_POOL_MAX_IDLE_PER_HOST HANDLES ARE KEPT PER HOST.
+FS_POOL_HEALTH_CHECK_AFTER  = 30
+FS_POOL_IDLE_TIMEOUT        = 300
+FS_POOL_MAX_IDLE_PER_HOST   = 4
+
+# ----------------------------------------------------------------------------
+# MAXIMUM NUMBER OF TASKS WHOSE LOCAL INPUT FILES ARE STAGED AS ONE BUNDLE
+# (RESOURCE(BUNDLE_INPUTS=TRUE))
+BUNDLE_MAX_TASKS            = 64
+
+# ----------------------------------------------------------------------------
+# CONTENT-ADDRESSED INPUT CACHE (RESOURCE(CACHE_INPUTS=TRUE)). THE CACHE LIVES
+# IN INPUT_CACHE_DIR IN THE REMOTE WORKING DIRECTORY. A WORKER WAITS AT MOST
+# INPUT_CACHE_WAIT_TIMEOUT SECONDS FOR ANOTHER WORKER TO UPLOAD A FILE.
+INPUT_CACHE_DIR             = '.cache'
+INPUT_CACHE_WAIT_TIMEOUT    = 3600
+
+# ----------------------------------------------------------------------------
+# CHUNKED TRANSFERS. FILES OF AT LEAST CHUNKED_TRANSFER_THRESHOLD BYTES (NONE
+# DISABLES CHUNKING) ARE TRANSFERRED IN CHUNKS OF CHUNKED_TRANSFER_CHUNK_SIZE
+# BYTES OVER CHUNKED_TRANSFER_STREAMS CONCURRENT STREAMS. EACH CHUNK IS TRIED
+# UP TO CHUNKED_TRANSFER_RETRIES TIMES. LOCAL OUTPUT FILES ARE ONLY CHECKED
+# AGAINST THE THRESHOLD IF THEIR DIRECTIVE HAS 'CHUNKED': TRUE OR 'STREAM':
+# TRUE, SO THAT OTHER OUTPUTS DON'T PAY FOR A REMOTE SIZE LOOKUP.
+CHUNKED_TRANSFER_THRESHOLD  = 512 * 1024 * 1024
+CHUNKED_TRANSFER_CHUNK_SIZE = 64 * 1024 * 1024
+CHUNKED_TRANSFER_STREAMS    = 4
+CHUNKED_TRANSFER_RETRIES    = 3
+
+# ----------------------------------------------------------------------------
+# SCRATCH GARBAGE COLLECTION (RESOURCE(SCRATCH_GC=DELETE OR ARCHIVE)). THE
+# WORKING DIRECTORY OF A FINISHED TASK IS COLLECTED SCRATCH_GC_MIN_AGE SECONDS
+# AFTER THE TASK (AND ALL TASKS USING ITS FILES) HAVE FINISHED. ARCHIVES GO
+# TO SCRATCH_GC_ARCHIVE_DIR IN THE REMOTE WORKING DIRECTORY. AT MOST
+# SCRATCH_GC_BATCH_SIZE DIRECTORIES ARE COLLECTED EVERY SCRATCH_GC_INTERVAL
+# SECONDS. WHILE FILES ARE BEING STAGED, COLLECTION WAITS FOR UP TO
+# SCRATCH_GC_MAX_DEFER SECONDS.
+DELETE                      = 'Delete'
+ARCHIVE                     = 'Archive'
+SCRATCH_GC_MIN_AGE          = 60
+SCRATCH_GC_ARCHIVE_DIR      = '.archive'
+SCRATCH_GC_BATCH_SIZE       = 100
+SCRATCH_GC_INTERVAL         = 10
+SCRATCH_GC_MAX_DEFER        = 300
+
+# ----------------------------------------------------------------------------
+# RETRIES OF FAILED FILE TRANSFERS. EVERY DIRECTIVE IS TRIED UP TO
+# TRANSFER_RETRIES TIMES (THE 'RETRIES' KEY OF A DIRECTIVE OVERRIDES THIS),
+# IF THE ERROR IS TRANSIENT (TIMEOUT, BROKEN CONNECTION, ...). THE
+# DELAY BEFORE A RETRY STARTS AT TRANSFER_RETRY_BACKOFF SECONDS AND DOUBLES
+# WITH EVERY ATTEMPT, UP TO TRANSFER_RETRY_MAX_DELAY SECONDS (WITH JITTER).
+TRANSFER_RETRIES            = 4
+TRANSFER_RETRY_BACKOFF      = 2
+TRANSFER_RETRY_MAX_DELAY    = 60
+
+# ----------------------------------------------------------------------------
+# MAXIMUM LENGTH OF A COMMAND LINE THAT IS SENT TO A REMOTE SHELL IN ONE GO.
+# INTERACTIVE SHELLS MIGHT TRUNCATE LONGER LINES.
+REMOTE_SHELL_MAX_COMMAND_LENGTH = 4000
 
 # ----------------------------------------------------------------------------
 # UPDATE INTERVAL OF THE THREAD MAIN LOOP
 UPDATE_INTERVAL           = 1
 
+# ----------------------------------------------------------------------------
+# INTERVAL (IN SECONDS) AT WHICH THE PILOT WORKERS POLL PILOT AND CU STATES.
+# IN BETWEEN, THE WORKERS BLOCK ON THE 'READY TO EXECUTE' QUEUE.
+STATE_POLL_INTERVAL       = 1
+
+# ----------------------------------------------------------------------------
+# POLL INTERVAL (IN SECONDS) OF THE LOCALHOST BACKEND. CHECKING THE STATE OF A
+# LOCAL SUBPROCESS IS CHEAP, SO THIS IS MUCH SHORTER.
+LOCAL_POLL_INTERVAL       = 0.1
+
+# ----------------------------------------------------------------------------
+# ADMISSION CONTROL. TASKS ARE ONLY SUBMITTED TO A PILOT IF IT HAS ENOUGH FREE
+# CORES. HIGHER PRIORITY TASKS GO FIRST. AMONG TASKS OF EQUAL PRIORITY,
+# ADMISSION_POLICY IS EITHER FIRST_FIT (IN ORDER) OR BEST_FIT (THE TASK THAT
+# LEAVES THE FEWEST FREE CORES). SMALLER TASKS ARE BACKFILLED AROUND BLOCKED
+# LARGER ONES UNTIL A BLOCKED TASK HAS WAITED FOR
+# BACKFILL_RESERVATION_TIMEOUT SECONDS.
+FIRST_FIT                 = 'FirstFit'
+BEST_FIT                  = 'BestFit'
+ADMISSION_POLICY          = FIRST_FIT
+BACKFILL_RESERVATION_TIMEOUT = 300
+
+# ----------------------------------------------------------------------------
+# MAXIMUM NUMBER OF CUs THAT ARE SUBMITTED IN ONE PASS OF THE SCHEDULING LOOP
+SUBMISSION_WINDOW         = 1000
+
 # ----------------------------------------------------------------------------
 # OTHER CONSTANTS
 LINK                      = 'Link'
@@ -25,6 +139,12 @@ LOCAL                     = 'LocalFile'
 REMOTE                    = 'RemoteFile'
 DEFAULT                   = 'Default'
 
+# ----------------------------------------------------------------------------
+# BACKENDS
+BIGJOB                    = 'BigJob'
+SAGA_PILOT                = 'SAGAPilot'
+LOCALHOST                 = 'Localhost'
+
 # ----------------------------------------------------------------------------
 # STATE CONSTANTS
 
@@ -40,3 +160,23 @@ TRANSFERRING_INPUT          = "TransferringInput"
 
 FAILED                      = "Failed"
 DONE                        = "Done"
+
+# ----------------------------------------------------------------------------
+# GZIP LEVEL (1-9) FOR COMPRESSED OUTPUT TRANSFERS (SEE RESOURCE
+# COMPRESS_OUTPUTS AND THE 'COMPRESS' KEY OF OUTPUT DIRECTIVES)
+OUTPUT_COMPRESSION_LEVEL  = 6
+
+# ----------------------------------------------------------------------------
+# INTERVAL (IN SECONDS) AT WHICH OUTPUT FILES WITH 'STREAM': TRUE ARE FETCHED
+# WHILE THEIR TASK IS RUNNING
+STREAM_SYNC_INTERVAL      = 60
+
+# ----------------------------------------------------------------------------
+# ADAPTIVE CU STATE POLLING. THE POLL INTERVAL OF A CU GROWS WITH THE TIME
+# IT HAS SPENT IN ITS CURRENT STATE (CU_POLL_BACKOFF * TIME IN STATE), BUT
+# STAYS WITHIN THE (MIN, MAX) BOUNDS (IN SECONDS) GIVEN FOR THE STATE.
+CU_POLL_BACKOFF           = 0.1
+CU_POLL_INTERVALS         = {
+    PENDING                     : (1, 60),
+    RUNNING                     : (1, 30),
+}
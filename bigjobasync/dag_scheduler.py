@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""Implements the dependency (DAG) aware release of tasks into the
+input transfer stage.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import threading
+import constants
+
+# ----------------------------------------------------------------------------
+#
+class _DAGScheduler(object):
+    """Holds back tasks until all tasks they depend on (Task.depends_on)
+    are DONE.
+
+    Ready tasks are passed to 'release_cb'. If a task fails, all tasks
+    that (directly or indirectly) depend on it are passed to 'fail_cb'
+    together with an error message. Independent branches of the graph
+    are released independently of each other.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, release_cb, fail_cb):
+        """Creates a new DAG scheduler.
+        """
+        self._release_cb = release_cb
+        self._fail_cb    = fail_cb
+
+        self._cond     = threading.Condition()
+        self._held     = {}   # uid -> task
+        self._missing  = {}   # uid -> set of unfinished parent uids
+        self._children = {}   # parent uid -> list of held child uids
+        self._done     = set()
+        self._failed   = set()
+        self._names    = {}   # uid -> task name, for log messages
+        self._known    = set()   # uids of all tasks that have been added
+
+    # ------------------------------------------------------------------------
+    #
+    def check(self, tasks):
+        """Raises an exception if 'tasks' can't be added, i.e., if they
+        contain a dependency cycle or depend on a task that is neither
+        finished nor added to this scheduler (it would never be released).
+        """
+        with self._cond:
+            self._check(tasks)
+
+    # ------------------------------------------------------------------------
+    #
+    def add(self, tasks):
+        """Adds tasks to the scheduler. Tasks without unfinished
+        dependencies are released right away, all others are held.
+        Raises an exception (and adds nothing) if check() fails.
+        """
+        ready  = []
+        failed = []
+
+        with self._cond:
+            self._check(tasks)
+
+            for task in tasks:
+                self._known.add(task.uid)
+
+            for task in tasks:
+                missing = set()
+                dead_parent = None
+
+                for parent in task.depends_on:
+                    self._names[parent.uid] = str(parent)
+                    if parent.uid in self._failed or parent.state == constants.FAILED:
+                        dead_parent = parent
+                        break
+                    if parent.uid in self._done or parent.state == constants.DONE:
+                        continue
+                    missing.add(parent.uid)
+
+                if dead_parent is not None:
+                    failed.append((task, dead_parent.uid))
+                elif len(missing) == 0:
+                    ready.append(task)
+                else:
+                    self._held[task.uid] = task
+                    self._missing[task.uid] = missing
+                    for parent_uid in missing:
+                        self._children.setdefault(parent_uid, []).append(task.uid)
+
+            self._release(ready)
+
+        for task, parent_uid in failed:
+            self._fail(task, parent_uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def task_done(self, uid):
+        """Marks a task as DONE and releases the tasks that have no more
+        unfinished dependencies.
+        """
+        ready = []
+
+        with self._cond:
+            self._done.add(uid)
+
+            for child_uid in self._children.pop(uid, []):
+                missing = self._missing.get(child_uid)
+                if missing is None:
+                    continue
+                missing.discard(uid)
+                if len(missing) == 0:
+                    del self._missing[child_uid]
+                    ready.append(self._held.pop(child_uid))
+
+            self._release(ready)
+
+    # ------------------------------------------------------------------------
+    #
+    def task_failed(self, uid):
+        """Marks a task as FAILED and fails all held tasks that depend on
+        it, directly or indirectly.
+        """
+        failed = []
+
+        with self._cond:
+            pending = [(uid, child_uid) for child_uid in self._children.pop(uid, [])]
+            self._failed.add(uid)
+
+            while len(pending) > 0:
+                parent_uid, child_uid = pending.pop()
+                if child_uid not in self._held:
+                    continue
+
+                child = self._held.pop(child_uid)
+                del self._missing[child_uid]
+                self._failed.add(child_uid)
+                failed.append((child, parent_uid))
+                self._names[child_uid] = str(child)
+
+                for grandchild_uid in self._children.pop(child_uid, []):
+                    pending.append((child_uid, grandchild_uid))
+
+            self._cond.notify_all()
+
+        for task, parent_uid in failed:
+            self._fail(task, parent_uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def join(self):
+        """Blocks until no more tasks are held back.
+        """
+        with self._cond:
+            while len(self._held) > 0:
+                # wait with a timeout so that the main thread stays
+                # responsive to KeyboardInterrupt
+                self._cond.wait(1)
+
+    # ------------------------------------------------------------------------
+    #
+    def _release(self, tasks):
+        # Called with the lock held, so that join() can't return before
+        # the released tasks have been handed over.
+        for task in tasks:
+            self._release_cb(task)
+
+        self._cond.notify_all()
+
+    # ------------------------------------------------------------------------
+    #
+    def _fail(self, task, parent_uid):
+        parent_name = self._names.get(parent_uid, parent_uid)
+        self._fail_cb(task, "Dependency '%s' failed." % parent_name)
+
+    # ------------------------------------------------------------------------
+    #
+    def _check(self, tasks):
+        """Called with the lock held.
+        """
+        new_uids = set([task.uid for task in tasks])
+
+        for task in tasks:
+            for parent in task.depends_on:
+                if parent.uid in new_uids or parent.uid in self._known:
+                    continue
+                if parent.state in [constants.DONE, constants.FAILED]:
+                    continue
+                raise Exception("Task '%s' depends on task '%s', which hasn't been scheduled." \
+                    % (task, parent))
+
+        for task in tasks:
+            self._check_cycles(task, new_uids)
+
+    # ------------------------------------------------------------------------
+    #
+    def _check_cycles(self, task, new_uids):
+        """Raises an exception if a task (indirectly) depends on itself.
+        """
+        stack   = [(task, [str(task)])]
+        visited = set()
+
+        while len(stack) > 0:
+            current, path = stack.pop()
+            for parent in current.depends_on:
+                if parent.uid == task.uid:
+                    raise Exception("Dependency cycle: %s" % \
+                        " -> ".join(path + [str(parent)]))
+                if parent.uid in visited:
+                    continue
+                visited.add(parent.uid)
+                if parent.uid in new_uids or parent.uid in self._held:
+                    stack.append((parent, path + [str(parent)]))
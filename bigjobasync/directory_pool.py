@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+
+"""Implements a pool of SAGA directory handles, so that the transfer
+workers don't have to open a new (ssh / sftp) connection for every task
+and file.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import time
+import saga
+import threading
+import constants
+
+from contextlib import contextmanager
+
+from logger import logger
+
+# ----------------------------------------------------------------------------
+#
+class _DirectoryPool(object):
+    """Pool of saga.filesystem.Directory handles, keyed by (scheme, host,
+    port, user). Each handle points to the root directory of its host, so
+    all operations on it have to use absolute paths or URLs.
+
+    A handle is only used by one thread at a time. Handles that have been
+    idle for a while are checked before they are handed out again and
+    handles that have been idle for longer than FS_POOL_IDLE_TIMEOUT are
+    closed. If 'max_per_host' is set, at most that many handles per host
+    are checked out at the same time; acquire() blocks until one is
+    returned.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, max_per_host=None):
+        """Creates a new, empty pool. Needs to be created in the process
+        that uses it, since handles can't be shared between processes.
+        """
+        self._lock = threading.Lock()
+        self._idle = {}   # key -> list of (handle, last_used)
+
+        self._max_per_host = max_per_host
+        self._host_slots   = {}   # key -> BoundedSemaphore
+
+    # ------------------------------------------------------------------------
+    #
+    @staticmethod
+    def root_url(url):
+        """Returns the key and the root URL of the host 'url' points to.
+        """
+        url = saga.Url(str(url))
+
+        netloc = url.host or 'localhost'
+        if url.username:
+            netloc = "%s@%s" % (url.username, netloc)
+        if url.port:
+            netloc = "%s:%s" % (netloc, url.port)
+
+        key = (url.scheme, url.host, url.port, url.username)
+        return key, "%s://%s/" % (url.scheme, netloc)
+
+    # ------------------------------------------------------------------------
+    #
+    @contextmanager
+    def directory(self, url):
+        """Context manager that checks out a handle for the host 'url'
+        points to and returns it to the pool afterwards.
+        """
+        key, handle = self.acquire(url)
+        healthy = True
+        try:
+            yield handle
+        except Exception:
+            # the operation might have failed because the connection
+            # broke. don't put it back without checking.
+            healthy = self._is_healthy(handle)
+            raise
+        finally:
+            self.release(key, handle, healthy)
+
+    # ------------------------------------------------------------------------
+    #
+    def acquire(self, url):
+        """Returns (key, handle) for the host 'url' points to. Reuses an
+        idle handle if there is a healthy one.
+        """
+        key, root = self.root_url(url)
+
+        slots = self._slots(key)
+        if slots is not None:
+            slots.acquire()
+        try:
+            return key, self._checkout(key, root)
+        except Exception:
+            if slots is not None:
+                slots.release()
+            raise
+
+    # ------------------------------------------------------------------------
+    #
+    def _checkout(self, key, root):
+        while True:
+            with self._lock:
+                idle = self._idle.get(key, [])
+                if len(idle) == 0:
+                    break
+                handle, last_used = idle.pop()
+
+            if time.time() - last_used < constants.FS_POOL_HEALTH_CHECK_AFTER \
+                or self._is_healthy(handle):
+                return handle
+
+            logger.info("Discarding broken directory handle for %s" % root)
+            self._close(handle)
+
+        logger.info("Opening new directory handle for %s" % root)
+        return saga.filesystem.Directory(root)
+
+    # ------------------------------------------------------------------------
+    #
+    def release(self, key, handle, healthy=True):
+        """Returns a handle to the pool. Unhealthy handles are closed.
+        """
+        slots = self._slots(key)
+        if slots is not None:
+            slots.release()
+
+        if healthy is False:
+            self._close(handle)
+            return
+
+        now = time.time()
+        with self._lock:
+            # with a per-host limit, keep enough idle handles for all
+            # concurrent users of the host
+            if self._max_per_host is None:
+                limit = constants.FS_POOL_MAX_IDLE_PER_HOST
+            else:
+                limit = max(constants.FS_POOL_MAX_IDLE_PER_HOST, self._max_per_host)
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < limit:
+                idle.append((handle, now))
+                handle = None
+            expired = self._evict(now)
+
+        if handle is not None:
+            self._close(handle)
+        for handle in expired:
+            self._close(handle)
+
+    # ------------------------------------------------------------------------
+    #
+    def close(self):
+        """Closes all idle handles.
+        """
+        with self._lock:
+            handles = [h for idle in self._idle.values() for h, _ in idle]
+            self._idle = {}
+
+        for handle in handles:
+            self._close(handle)
+
+    # ------------------------------------------------------------------------
+    #
+    def _slots(self, key):
+        if self._max_per_host is None:
+            return None
+        with self._lock:
+            slots = self._host_slots.get(key)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self._max_per_host)
+                self._host_slots[key] = slots
+            return slots
+
+    # ------------------------------------------------------------------------
+    #
+    def _evict(self, now):
+        # Called with the lock held. Returns the expired handles.
+        expired = []
+        for key, idle in self._idle.items():
+            keep = []
+            for handle, last_used in idle:
+                if now - last_used > constants.FS_POOL_IDLE_TIMEOUT:
+                    expired.append(handle)
+                else:
+                    keep.append((handle, last_used))
+            if len(keep) > 0:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    # ------------------------------------------------------------------------
+    #
+    def _is_healthy(self, handle):
+        try:
+            return handle.is_dir('/')
+        except Exception:
+            return False
+
+    # ------------------------------------------------------------------------
+    #
+    def _close(self, handle):
+        try:
+            handle.close()
+        except Exception, ex:
+            logger.debug("Couldn't close directory handle: %s" % str(ex))
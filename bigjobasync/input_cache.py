@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""Implements the content-addressed remote cache for local input files.
+Files with the same content are uploaded only once per resource and
+linked into the task working directories.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import time
+import uuid
+import saga
+import threading
+import constants
+
+from task_queue        import _TaskQueueManager
+from directory_pool    import _DirectoryPool
+from transfer_manifest import _file_sha1
+
+# ----------------------------------------------------------------------------
+#
+class _InputCacheIndex(object):
+    """Keeps track of the cache entries that have been uploaded or are
+    being uploaded. Lives in the manager process, so that all transfer
+    workers upload a file only once, even if they stage it concurrently.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self):
+        self._cond      = threading.Condition()
+        self._cached    = set()
+        self._uploading = set()
+
+    # ------------------------------------------------------------------------
+    #
+    def claim(self, entry, timeout):
+        """Returns True if the caller should upload 'entry' and False if
+        it is in the cache. Waits if another worker is uploading it.
+        """
+        deadline = time.time() + timeout
+
+        with self._cond:
+            while entry in self._uploading:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise Exception("Timed out waiting for the upload of cache entry '%s'." % entry)
+                self._cond.wait(remaining)
+
+            if entry in self._cached:
+                return False
+
+            self._uploading.add(entry)
+            return True
+
+    # ------------------------------------------------------------------------
+    #
+    def finish(self, entry, success):
+        """Called by the worker that has claimed 'entry' after the upload.
+        If it failed, the next worker that claims it tries again.
+        """
+        with self._cond:
+            self._uploading.discard(entry)
+            if success is True:
+                self._cached.add(entry)
+            self._cond.notify_all()
+
+# The index is hosted by the same manager process as the task queues.
+_TaskQueueManager.register('InputCacheIndex', _InputCacheIndex,
+    exposed=['claim', 'finish'])
+
+
+# ----------------------------------------------------------------------------
+#
+class _InputCache(object):
+    """Worker-side part of the cache. Stages local files through the cache
+    directory (INPUT_CACHE_DIR) in the resource's remote working directory.
+    Entries are named after the SHA-1 of the file content.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, index, fs_pool):
+        self._index   = index
+        self._fs_pool = fs_pool
+        self._digests = {}   # (path, size, mtime) -> digest
+
+    # ------------------------------------------------------------------------
+    #
+    def stage(self, task, local_path, task_workdir_url):
+        """Makes the local file available in the task's working directory
+        as a link to the cache entry. Uploads the file into the cache if
+        it isn't there yet.
+        """
+        digest = self._digest(local_path)
+
+        cache_dir  = "%s/%s" % (saga.Url(task.remote_workdir_url).path.rstrip('/'),
+            constants.INPUT_CACHE_DIR)
+        cache_path = "%s/%s" % (cache_dir, digest)
+        target     = "%s/%s" % (saga.Url(task_workdir_url).path, os.path.basename(local_path))
+
+        _, root_url = _DirectoryPool.root_url(task_workdir_url)
+        entry = "%s%s" % (root_url, cache_path)
+
+        if self._index.claim(entry, constants.INPUT_CACHE_WAIT_TIMEOUT) is True:
+            success = False
+            try:
+                with self._fs_pool.directory(task_workdir_url) as root:
+                    # the entry might be left over from an earlier run
+                    if root.exists(cache_path):
+                        task._log.append("Found LOCAL input file '%s' in the cache (%s)" % (local_path, digest))
+                    else:
+                        task._log.append("Uploading LOCAL input file '%s' into the cache (%s)" % (local_path, digest))
+                        # upload under a temporary name, so that nobody
+                        # links a partial file
+                        tmp_path = "%s/.%s.%s" % (cache_dir, digest, uuid.uuid4())
+                        root.make_dir(cache_dir, saga.filesystem.CREATE_PARENTS)
+                        root.copy("file://localhost//%s" % local_path, tmp_path)
+                        root.move(tmp_path, cache_path)
+                success = True
+            finally:
+                self._index.finish(entry, success)
+        else:
+            task._log.append("Linking LOCAL input file '%s' from the cache (%s)" % (local_path, digest))
+
+        with self._fs_pool.directory(task_workdir_url) as root:
+            root.link(cache_path, target)
+
+    # ------------------------------------------------------------------------
+    #
+    def _digest(self, path):
+        """Returns the SHA-1 of the file content. Digests are remembered
+        as long as size and mtime of the file don't change.
+        """
+        stat = os.stat(path)
+        key  = (path, stat.st_size, stat.st_mtime)
+
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = _file_sha1(path)
+            self._digests[key] = digest
+
+        return digest
@@ -9,15 +9,25 @@ __email__     = "ole.weidner@rutgers.edu"
 __copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
 __license__   = "MIT"
 
+import os
 import saga
-import time
 import Queue
+import pipes
+import tarfile
+import tempfile
 import constants
 import subprocess
 import multiprocessing
 
-from task import Task
+from task_spec         import _ActiveTask, _TaskRef
+from input_cache       import _InputCache
+from remote_shell      import _RemoteShellCache
+from directory_pool    import _DirectoryPool
+from bulk_transfer     import _BulkTransfer
+from chunked_transfer  import _ChunkedTransfer
+from transfer_manifest import _TransferManifest
 
+from retry  import _with_retries, _is_transient
 from logger import logger
 
 
@@ -27,13 +37,16 @@ class _InputTransferWorker(multiprocessing.Process):
 
     # ------------------------------------------------------------------------
     #
-    def __init__(self, wid, ready_to_transfer_input_q, ready_to_exec_q,
-                 done_q, failed_q):
+    def __init__(self, wid, resource_obj, ready_to_transfer_input_q,
+                 ready_to_exec_q, done_q, failed_q, state_channel,
+                 input_cache_index=None, progress=None):
         """DS
         """
         multiprocessing.Process.__init__(self)
         self.daemon = True
-        self._stop  = False
+        self._stop  = multiprocessing.Event()
+
+        self._res_obj = resource_obj
 
         # All queue an InputFileTransferWorker can access
         self._tasks_done_q = done_q
@@ -41,42 +54,510 @@ class _InputTransferWorker(multiprocessing.Process):
         self._tasks_ready_to_exec_q = ready_to_exec_q
         self._tasks_ready_to_transfer_input_q = ready_to_transfer_input_q
 
+        # Task state changes are published to the parent process
+        self._state_channel = state_channel
+
+        # Shared counter of processed tasks (used by the worker pool to
+        # measure the throughput), or None
+        self._progress = progress
+
+        # Directory handles and shells are kept per host. They are
+        # created in run(), i.e., in the worker process.
+        self._fs_pool = None
+        self._shells  = None
+        self._chunked = None
+        self._bulk    = None
+
+        # Shared index of the remote input cache, None if the cache is
+        # disabled.
+        self._input_cache_index = input_cache_index
+        self._input_cache       = None
+
+        # The transfer manifest, if enabled, is opened in run().
+        self._manifest = None
+
         logger.info("Starting InputTransferWorker %d using SAGA version %s" % (wid, saga.version))
 
 
     # ------------------------------------------------------------------------
     #
     def stop(self):
-        """DS
+        """Signals the worker to terminate. Can be called from the parent
+        process. Putting None (poison pill) into the queue has the same
+        effect, but only after all tasks before it have been processed.
         """
-        self._stop = True
+        self._stop.set()
 
     # ------------------------------------------------------------------------
     #
     def run(self):
         """DS
         """
-        while self._stop is False:
-            while True:
-                try:
-                    task = self._tasks_ready_to_transfer_input_q.get_nowait()
-                    # transfer_input_file tries to transfer the input files 
-                    # for a given task and puts it afterwards either in the 
-                    # 'ready_to_exec' or 'failed' queues. 
-                    self.transfer_input_file(task)
-                    #self._tasks_ready_to_exec_q.put(task)
-                    self._tasks_ready_to_transfer_input_q.task_done()
+        fs_pool = _DirectoryPool()
+        shells  = _RemoteShellCache()
+        self._open_session(fs_pool, shells)
+        try:
+            self._process_tasks()
+        finally:
+            shells.close()
+            fs_pool.close()
+
+    # ------------------------------------------------------------------------
+    #
+    def _open_session(self, fs_pool, shells):
+        """Sets up the per-process transfer state. 'fs_pool' and 'shells'
+        can be shared with other workers in the same process.
+        """
+        self._fs_pool = fs_pool
+        self._shells  = shells
+        self._chunked = _ChunkedTransfer(self._fs_pool, self._shells)
+        self._bulk    = _BulkTransfer(self._fs_pool, self._shells)
+        if self._input_cache_index is not None:
+            self._input_cache = _InputCache(self._input_cache_index, self._fs_pool)
+        if self._res_obj.get('transfer_manifest') is not None:
+            self._manifest = _TransferManifest(self._res_obj['transfer_manifest'])
+
+    # ------------------------------------------------------------------------
+    #
+    def _count_progress(self):
+        if self._progress is not None:
+            with self._progress.get_lock():
+                self._progress.value += 1
+
+    # ------------------------------------------------------------------------
+    #
+    def _process_tasks(self):
+        """Processes tasks until the worker is stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                # block until there's a new task, but wake up every now
+                # and then to check the stop flag.
+                spec = self._tasks_ready_to_transfer_input_q.get(True, constants.TRANSFER_WORKER_TIMEOUT)
+            except Queue.Empty:
+                continue
+
+            if spec is None:
+                # poison pill: we are done.
+                self._tasks_ready_to_transfer_input_q.task_done()
+                break
+
+            specs, got_pill = self._get_batch([spec])
+            self._process_batch(specs)
+
+            if got_pill is True:
+                self._tasks_ready_to_transfer_input_q.task_done()
+                break
+
+    # ------------------------------------------------------------------------
+    #
+    def _process_batch(self, specs):
+        """Transfers the input files of the tasks in 'specs' and marks them
+        as done in the input queue.
+        """
+        tasks = [_ActiveTask(spec, self._state_channel) for spec in specs]
+
+        bundled = set()
+        if len(tasks) > 1 and self._bundle_inputs() is True:
+            bundled = self._stage_bundle(tasks)
+
+        batched = {}
+        if self._res_obj.get('batch_remote_inputs') is True:
+            batched = self._stage_remote_batch(tasks)
+
+        for task in tasks:
+            try:
+                # transfer_input_file tries to transfer the input files
+                # for a given task and puts it afterwards into the next
+                # queue or the 'failed' queue.
+                self.transfer_input_file(task, local_staged=(task.uid in bundled),
+                    remote_staged=batched.get(task.uid))
+            except Exception, ex:
+                logger.error("Unexpected error during input transfer: %s" % str(ex))
+                task._log.append(str(ex))
+                task._set_state(constants.FAILED)
+                self._tasks_failed_q.put(task.spec)
+            finally:
+                self._tasks_ready_to_transfer_input_q.task_done()
+                self._count_progress()
+
+    # ------------------------------------------------------------------------
+    #
+    def _find_unchanged(self, origin_path, task_workdir_url):
+        """Returns the remote path of an earlier upload of 'origin_path' if
+        neither the local file nor the remote copy have changed since,
+        otherwise None.
+        """
+        _, host_url = _DirectoryPool.root_url(task_workdir_url)
+
+        entry = self._manifest.lookup(origin_path, host_url)
+        if entry is None:
+            return None
+
+        with self._fs_pool.directory(task_workdir_url) as root:
+            if not root.exists(entry['remote_path']) or \
+                root.get_size(entry['remote_path']) != entry['size']:
+                return None
+
+        return entry['remote_path']
+
+    # ------------------------------------------------------------------------
+    #
+    def _copy_unchanged(self, task, origin_path, task_workdir_url):
+        """Copies an earlier upload of 'origin_path' on the remote side
+        instead of uploading the file again. Returns False if there is no
+        (unchanged) earlier upload.
+        """
+        try:
+            remote_path = self._find_unchanged(origin_path, task_workdir_url)
+            if remote_path is None:
+                task._log.append("LOCAL input file '%s' is new or has changed since the last upload" % origin_path)
+                return False
+
+            with self._fs_pool.directory(task_workdir_url) as root:
+                root.copy(remote_path, saga.Url(task_workdir_url).path)
+
+        except Exception, ex:
+            task._log.append("Couldn't reuse earlier upload of LOCAL input file '%s': %s" % (origin_path, str(ex)))
+            return False
+
+        task._log.append("Skipping upload of unchanged LOCAL input file '%s', copying earlier upload '%s'" \
+            % (origin_path, remote_path))
+        return True
+
+    # ------------------------------------------------------------------------
+    #
+    def _record_upload(self, task, origin_path, task_workdir_url):
+        """Records an upload in the manifest (if there is one).
+        """
+        if self._manifest is None:
+            return
+
+        _, host_url = _DirectoryPool.root_url(task_workdir_url)
+        remote_path = "%s/%s" % (saga.Url(task_workdir_url).path, os.path.basename(origin_path))
+        try:
+            self._manifest.record(origin_path, host_url, remote_path)
+        except Exception, ex:
+            # not fatal, the file is just uploaded again next time
+            task._log.append("Couldn't record upload in the transfer manifest: %s" % str(ex))
+
+    # ------------------------------------------------------------------------
+    #
+    def _stage_cached(self, task, origin_path, task_workdir_url):
+        """Stages a local file through the input cache. Returns False if
+        that didn't work and the file should be copied directly.
+        """
+        try:
+            self._input_cache.stage(task, origin_path, task_workdir_url)
+            return True
+        except Exception, ex:
+            task._log.append("Couldn't stage LOCAL input file '%s' through the cache: %s" % (origin_path, str(ex)))
+            return False
+
+    # ------------------------------------------------------------------------
+    #
+    def _bundle_inputs(self):
+        return self._res_obj.get('bundle_inputs') is True and self._input_cache is None
+
+    # ------------------------------------------------------------------------
+    #
+    def _get_batch(self, specs):
+        """If bundled staging or batched remote staging is enabled, adds
+        the tasks that are waiting in the queue to 'specs' (up to
+        BUNDLE_MAX_TASKS), so that the inputs of the whole batch can be
+        staged at once. Returns (specs, got_pill).
+        """
+        if self._bundle_inputs() is False and self._res_obj.get('batch_remote_inputs') is not True:
+            return specs, False
+
+        while len(specs) < constants.BUNDLE_MAX_TASKS:
+            try:
+                spec = self._tasks_ready_to_transfer_input_q.get_nowait()
+            except Queue.Empty:
+                break
+            if spec is None:
+                return specs, True
+            specs.append(spec)
+
+        return specs, False
+
+    # ------------------------------------------------------------------------
+    #
+    def _stage_bundle(self, tasks):
+        """Packs the LOCAL COPY inputs of 'tasks' into one tar archive,
+        transfers it and unpacks it into the task directories with a
+        single remote command. Returns the uids of the tasks whose local
+        inputs have been staged.
+
+        Tasks with missing local files are left out, so they fail (with
+        the usual error) in transfer_input_file(). If the bundle can't be
+        staged, all tasks fall back to per-file transfers.
+        """
+        bundles = {}   # remote workdir url -> [(task, [local paths])]
+
+        for task in tasks:
+            paths = [d['origin_path'] for d in task.input \
+                if d['origin'] == constants.LOCAL and d['mode'] == constants.COPY \
+                and not _BulkTransfer.applies_to(d)]
+            if len(paths) == 0:
+                continue
+            if not all([os.path.isfile(path) for path in paths]):
+                continue
+            if self._manifest is not None and all([self._is_unchanged(path, task) for path in paths]):
+                # these get copied on the remote side
+                continue
+            bundles.setdefault(task.remote_workdir_url, []).append((task, paths))
+
+        staged = set()
+
+        for remote_workdir_url, entries in bundles.items():
+            if len(entries) < 2:
+                # nothing to gain
+                continue
+
+            for task, _ in entries:
+                task._set_state(constants.TRANSFERRING_INPUT)
+
+            try:
+                self._transfer_bundle(remote_workdir_url, entries)
+            except Exception, ex:
+                logger.warning("Bundled input staging failed, falling back to per-file transfers: %s" % str(ex))
+                continue
+
+            for task, paths in entries:
+                staged.add(task.uid)
+                task_workdir_url = "%s/%s" % (task.remote_workdir_url, task.dir_name)
+                for path in paths:
+                    self._record_upload(task, path, task_workdir_url)
+
+        return staged
+
+    # ------------------------------------------------------------------------
+    #
+    def _is_unchanged(self, path, task):
+        try:
+            task_workdir_url = "%s/%s" % (task.remote_workdir_url, task.dir_name)
+            return self._find_unchanged(path, task_workdir_url) is not None
+        except Exception:
+            return False
+
+    # ------------------------------------------------------------------------
+    #
+    def _transfer_bundle(self, remote_workdir_url, entries):
+        """Streams the files into a local tar archive, copies it into the
+        remote working directory and unpacks it there.
+        """
+        fd, bundle_path = tempfile.mkstemp(prefix="bja-", suffix=".tar")
+        try:
+            with os.fdopen(fd, 'wb') as bundle_file:
+                tar = tarfile.open(fileobj=bundle_file, mode='w|')
+                for task, paths in entries:
+                    for path in paths:
+                        tar.add(path, arcname="%s/%s" % (task.dir_name, os.path.basename(path)))
+                tar.close()
+
+            workdir_path  = saga.Url(remote_workdir_url).path.rstrip('/')
+            remote_bundle = "%s/.%s" % (workdir_path, os.path.basename(bundle_path))
 
-                except Queue.Empty:
-                    break
+            with self._fs_pool.directory(remote_workdir_url) as root:
+                root.make_dir(workdir_path, saga.filesystem.CREATE_PARENTS)
+                root.copy("file://localhost//%s" % bundle_path, remote_bundle)
 
-            time.sleep(1)
+            # always remove the archive, but report tar's exit code
+            self._shells.get(remote_workdir_url).run(
+                "(cd %s && tar xf %s); rc=$?; rm -f %s; test $rc -eq 0" \
+                % (pipes.quote(workdir_path), pipes.quote(remote_bundle), pipes.quote(remote_bundle)))
+
+        finally:
+            os.remove(bundle_path)
+
+        logger.info("Staged %d local input files of %d tasks as one bundle" \
+            % (sum([len(paths) for _, paths in entries]), len(entries)))
 
     # ------------------------------------------------------------------------
     #
-    def transfer_input_file(self, task):
+    def _stage_remote_batch(self, tasks):
+        """Runs the REMOTE and task output COPY / LINK directives of 'tasks'
+        as one generated script per remote working directory. Returns
+        {task uid: {directive index: None or error message}} for the tasks
+        whose directives have been run.
+
+        Directives with other modes or with origin URLs are left to
+        transfer_input_file(). If a script can't be run, its tasks fall
+        back to per-directive transfers.
+        """
+        batches = {}   # remote workdir url -> [(task, [(index, mode, source)])]
+
+        for task in tasks:
+            ops = []
+            for index, directive in enumerate(task.input):
+                mode   = directive['mode']
+                origin = directive['origin']
+                if mode not in [constants.COPY, constants.LINK] or _BulkTransfer.applies_to(directive):
+                    continue
+                if origin == constants.REMOTE:
+                    if "://" in directive['origin_path']:
+                        continue
+                    source = directive['origin_path']
+                elif isinstance(origin, _TaskRef):
+                    source = "%s/%s/%s" % (saga.Url(origin.remote_workdir_url).path,
+                        origin.dir_name, directive['origin_path'])
+                else:
+                    continue
+                ops.append((index, mode, source))
+            if len(ops) > 0:
+                batches.setdefault(task.remote_workdir_url, []).append((task, ops))
+
+        results = {}
+
+        for remote_workdir_url, entries in batches.items():
+            for task, _ in entries:
+                task._set_state(constants.TRANSFERRING_INPUT)
+
+            try:
+                results.update(self._run_remote_batch(remote_workdir_url, entries))
+            except Exception, ex:
+                logger.warning("Batched remote input staging failed, falling back to per-file transfers: %s" % str(ex))
+
+        return results
+
+    # ------------------------------------------------------------------------
+    #
+    def _run_remote_batch(self, remote_workdir_url, entries):
+        """Generates the script for 'entries', runs it and maps the status
+        lines it prints back to the tasks and directives.
+        """
+        workdir_path = saga.Url(remote_workdir_url).path.rstrip('/')
+
+        # Every operation prints one 'BJA <op> <exit code> <error>' line.
+        # The operations run in a subshell in the task's working directory,
+        # so that relative paths are resolved against it.
+        script = []
+        ops    = []
+        for task, task_ops in entries:
+            task_path = "%s/%s" % (workdir_path, task.dir_name)
+            # a failing mkdir is reported by the operations below
+            script.append("{ mkdir -p %s || true; }" % pipes.quote(task_path))
+            for index, mode, source in task_ops:
+                if mode == constants.COPY:
+                    cmd = "cp -f %s ." % pipes.quote(source)
+                else:
+                    # ln doesn't complain about missing sources
+                    cmd = "ls -d %s > /dev/null && ln -sfn %s %s" % (pipes.quote(source),
+                        pipes.quote(source), pipes.quote(os.path.basename(source)))
+                script.append("err=$( (cd %s && %s) 2>&1); rc=$?; printf 'BJA %d %%s ' $rc; printf %%s \"$err\" | tr '\\n' ' '; echo" \
+                    % (pipes.quote(task_path), cmd, len(ops)))
+                ops.append((task, index, mode, source))
+
+        # A batch can be far longer than the line length an interactive
+        # shell accepts, so it is sent in several lines.
+        out = self._shells.get(remote_workdir_url).run_script(script)
+
+        status = {}
+        for line in out.splitlines():
+            fields = line.split(' ', 3)
+            if len(fields) >= 3 and fields[0] == 'BJA':
+                status[int(fields[1])] = (int(fields[2]), fields[3] if len(fields) > 3 else '')
+
+        results = {}
+        for op, (task, index, mode, source) in enumerate(ops):
+            rc, err = status.get(op, (None, "no status reported"))
+            if rc == 0:
+                error = None
+            else:
+                error = "Couldn't %s REMOTE input file '%s': %s" \
+                    % ('copy' if mode == constants.COPY else 'link', source, err)
+            results.setdefault(task.uid, {})[index] = error
+
+        logger.info("Staged %d remote input files of %d tasks with one remote script" % (len(ops), len(entries)))
+        return results
+
+    # ------------------------------------------------------------------------
+    #
+    def _upload(self, task, origin_path, task_workdir_url, attempt):
+        """Copies a local file into the task's working directory.
+        """
+        size = os.path.getsize(origin_path)
+        if _ChunkedTransfer.applies_to(size) or \
+            (attempt > 1 and size > constants.CHUNKED_TRANSFER_CHUNK_SIZE):
+            # large files go in parallel chunks. So do retries of files
+            # with more than one chunk, so that the next retry resumes
+            # where this one stops.
+            self._chunked.upload(origin_path, "%s/%s" % (task_workdir_url,
+                os.path.basename(origin_path)), task._log)
+        else:
+            with self._fs_pool.directory(task_workdir_url) as root:
+                root.copy("file://localhost//%s" % origin_path, task_workdir_url)
+
+    # ------------------------------------------------------------------------
+    #
+    def _remote_op(self, task_workdir_url, mode, source):
+        """Copies or links 'source' on the remote side into the task's
+        working directory.
+        """
+        task_workdir_path = saga.Url(task_workdir_url).path
+
+        # The pooled handle points to the root directory, so relative
+        # paths are resolved against the task's working directory.
+        if "://" not in source and not source.startswith("/"):
+            source = "%s/%s" % (task_workdir_path, source)
+
+        with self._fs_pool.directory(task_workdir_url) as root:
+            if mode == constants.COPY:
+                # copy around stuff locally on the remote machine
+                root.copy(source, task_workdir_path)
+            else:
+                # link stuff instead of copying it
+                root.link(source, task_workdir_path)
+
+    # ------------------------------------------------------------------------
+    #
+    def _transfer_bulk(self, task, directive, task_workdir_url):
+        """Transfers the files of a glob or recursive directive.
+        """
+        mode        = directive['mode']
+        origin      = directive['origin']
+        origin_path = directive['origin_path']
+
+        if origin == constants.LOCAL:
+            if mode != constants.COPY:
+                raise Exception("Mode '%s' is not supported for local-to-remote transfers." % mode)
+            _with_retries(
+                lambda attempt: self._bulk.upload(origin_path, task_workdir_url, task._log),
+                task._log, "upload of LOCAL input '%s'" % origin_path,
+                directive.get('retries'))
+            return
+
+        if origin == constants.REMOTE:
+            if "://" in origin_path:
+                raise Exception("Glob and recursive directives need a path, not a URL: '%s'" % origin_path)
+            source = origin_path
+        elif isinstance(origin, _TaskRef):
+            source = "%s/%s/%s" % (saga.Url(origin.remote_workdir_url).path, origin.dir_name, origin_path)
+        else:
+            raise Exception("Unsupported origin type '%s'" % origin)
+
+        if mode not in [constants.COPY, constants.LINK]:
+            raise Exception("Unsupported transfer mode '%s'" % mode)
+
+        _with_retries(
+            lambda attempt: self._bulk.remote(source, task_workdir_url, '.', mode, task._log),
+            task._log, "%s of REMOTE input '%s'" % (mode.lower(), source),
+            directive.get('retries'))
+
+    # ------------------------------------------------------------------------
+    #
+    def transfer_input_file(self, task, local_staged=False, remote_staged=None):
         """DOCSTRING
+
+        If 'local_staged' is True, the LOCAL COPY inputs have already been
+        staged as part of a bundle. 'remote_staged' maps the indices of the
+        REMOTE / task output directives that have been run as part of a
+        batch to None (success) or an error message.
         """
+        if remote_staged is None:
+            remote_staged = {}
+
         # Change the task state to 'TransferringInput'
         task._set_state(constants.TRANSFERRING_INPUT)
 
@@ -84,25 +565,50 @@ class _InputTransferWorker(multiprocessing.Process):
         # input data has been staged. 
         try:
             # create working directories for tasks based on the task uid
-            task_workdir_url = "%s/%s" % (task._remote_workdir_url, task.dir_name)
-            task._log.append("Creating working directory '%s'" % task.dir_name)
+            task_workdir_url = "%s/%s" % (task.remote_workdir_url, task.dir_name)
+            task_workdir_path = saga.Url(task_workdir_url).path
 
-            task_workdir = saga.filesystem.Directory(task_workdir_url, 
-                saga.filesystem.CREATE_PARENTS)
+            # the directory might have been created at schedule time
+            if task.workdir_created is not True:
+                task._log.append("Creating working directory '%s'" % task.dir_name)
+                with self._fs_pool.directory(task_workdir_url) as root:
+                    root.make_dir(task_workdir_path, saga.filesystem.CREATE_PARENTS)
 
         except Exception, ex:
             task._log.append(str(ex))
             task._set_state(constants.FAILED)
-            self._tasks_failed_q.put(task)
+            self._tasks_failed_q.put(task.spec)
             return
 
         # Next we can take care of the file transfers
-        for directive in task.input:
+        for index, directive in enumerate(task.input):
 
             mode        = directive['mode']
             origin      = directive['origin']
             origin_path = directive['origin_path']
 
+            if index in remote_staged:
+                if remote_staged[index] is None:
+                    task._log.append("%s REMOTE input file '%s' as part of a batch" \
+                        % ('Copied' if mode == constants.COPY else 'Linked', origin_path))
+                    continue
+                task._log.append(remote_staged[index])
+                if not _is_transient(Exception(remote_staged[index])):
+                    task._set_state(constants.FAILED)
+                    self._tasks_failed_q.put(task.spec)
+                    return
+                # tried again (with retries) below
+
+            if _BulkTransfer.applies_to(directive):
+                try:
+                    self._transfer_bulk(task, directive, task_workdir_url)
+                except Exception, ex:
+                    task._log.append(str(ex))
+                    task._set_state(constants.FAILED)
+                    self._tasks_failed_q.put(task.spec)
+                    return
+                continue
+
             ####################################################################
             #
             # COPY LOCAL TO REMOTE FILE
@@ -111,28 +617,40 @@ class _InputTransferWorker(multiprocessing.Process):
                 if mode == constants.LINK:
                     task._log.append("Mode '%s' is not supported for local-to-remote transfers." % mode)
                     task._set_state(constants.FAILED)
-                    self._tasks_failed_q.put(task)
+                    self._tasks_failed_q.put(task.spec)
                     return
 
+                elif mode == constants.COPY and local_staged is True:
+                    task._log.append("Copied LOCAL input file '%s' as part of a bundle" % origin_path)
+
                 elif mode == mode == constants.COPY:
+                    if self._manifest is not None and \
+                        self._copy_unchanged(task, origin_path, task_workdir_url) is True:
+                        continue
+
+                    if self._input_cache is not None and \
+                        self._stage_cached(task, origin_path, task_workdir_url) is True:
+                        continue
+
                     try: 
                         # we use saga-python to copy a local file to the 
                         # remote destination
                         task._log.append("Copying LOCAL input file '%s'" % origin_path)
-                        local_filename = "file://localhost//%s" % origin_path
-                        local_file = saga.filesystem.File(local_filename)
-                        local_file.copy(task_workdir_url)
-                        local_file.close()
+                        _with_retries(
+                            lambda attempt: self._upload(task, origin_path, task_workdir_url, attempt),
+                            task._log, "upload of LOCAL input file '%s'" % origin_path,
+                            directive.get('retries'))
+                        self._record_upload(task, origin_path, task_workdir_url)
                     except Exception, ex:
                         task._log.append(str(ex))
                         task._set_state(constants.FAILED)
-                        self._tasks_failed_q.put(task)
+                        self._tasks_failed_q.put(task.spec)
                         return 
 
                 else:
                     raise task._log.append("Unsupported transfer mode '%s'" % mode)
                     task._set_state(constants.FAILED)
-                    self._tasks_failed_q.put(task)
+                    self._tasks_failed_q.put(task.spec)
                     return
 
             ####################################################################
@@ -140,42 +658,42 @@ class _InputTransferWorker(multiprocessing.Process):
             # COPY / LINK REMOTE TO REMOTE FILE
             elif origin == constants.REMOTE:
                 try: 
-                    if mode == constants.COPY:
-                        # copy around stuff locally on the remote machine
-                        task_workdir.copy(origin_path, ".")
-                    elif mode == constants.LINK: 
-                        # link stuff instead of copying it
-                        task_workdir.link(origin_path, ".")
-                    else:
+                    if mode not in [constants.COPY, constants.LINK]:
                         raise Exception("Unsupported transfer mode '%s'" % mode)
+                    _with_retries(
+                        lambda attempt: self._remote_op(task_workdir_url, mode, origin_path),
+                        task._log, "%s of REMOTE input file '%s'" % (mode.lower(), origin_path),
+                        directive.get('retries'))
 
                 except Exception, ex:
                     task._log.append(str(ex))
                     task._set_state(constants.FAILED)
-                    self._tasks_failed_q.put(task)
+                    self._tasks_failed_q.put(task.spec)
                     return 
 
             ####################################################################
             #
             # COPY / LINK TASK OUTPUT TO OTHER 
-            elif isinstance(origin, Task):
+            elif isinstance(origin, _TaskRef):
                 try: 
-                    source = "%s/%s/%s" % (saga.Url(origin._remote_workdir_url).path, origin._dir_name, origin_path)
+                    source = "%s/%s/%s" % (saga.Url(origin.remote_workdir_url).path, origin.dir_name, origin_path)
 
                     if mode == constants.COPY:
                         task._log.append("Copying REMOTE input file '%s'" % source)
-                        task_workdir.copy(source, ".")
-
                     elif mode == constants.LINK:
                         task._log.append("Linking REMOTE input file '%s'" % source)
-                        task_workdir.link(source, ".")
                     else: 
-                        raise task._log.append("Unsupported transfer mode '%s'" % mode)
+                        raise Exception("Unsupported transfer mode '%s'" % mode)
+
+                    _with_retries(
+                        lambda attempt: self._remote_op(task_workdir_url, mode, source),
+                        task._log, "%s of REMOTE input file '%s'" % (mode.lower(), source),
+                        directive.get('retries'))
 
                 except Exception, ex:
                     task._log.append(str(ex))
                     task._set_state(constants.FAILED)
-                    self._tasks_failed_q.put(task)
+                    self._tasks_failed_q.put(task.spec)
                     return
 
             ####################################################################
@@ -183,17 +701,10 @@ class _InputTransferWorker(multiprocessing.Process):
             else:
                 raise task._log.append("Unsupported origin type '%s'" % origin)
                 task._set_state(constants.FAILED)
-                self._tasks_failed_q.put(task)
+                self._tasks_failed_q.put(task.spec)
                 return  
 
-
-        try:
-            task_workdir.close()
-        except Exception, ex:
-            task._log.append(str(ex))
-            # don't propagate a 'FAILED' state here
-
         # Set state to 'Pending'. From here on, BigJob will
         # determine the state of this task.
         task._set_state(constants.WAITING_FOR_EXECUTION)
-        self._tasks_ready_to_exec_q.put(task)
+        self._tasks_ready_to_exec_q.put(task.spec)
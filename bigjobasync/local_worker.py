@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""Implements a resource and task management multiprocessing.Process
+that runs tasks on the local machine, without Redis or pilots.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import saga
+import errno
+import constants
+import subprocess
+
+from collections  import deque
+
+from logger       import logger
+from pilot_worker import _PilotWorker
+
+# ----------------------------------------------------------------------------
+#
+class _LocalComputeUnitDescription(object):
+    """Same attributes as the BigJob ComputeUnitDescription.
+    """
+    executable          = None
+    arguments           = []
+    environment         = {}
+    working_directory   = None
+    number_of_processes = 1
+    output              = "STDOUT"
+    error               = "STDERR"
+
+
+# ----------------------------------------------------------------------------
+#
+class _LocalComputeUnit(object):
+    """A CU that runs as a subprocess. Uses the BigJob CU state names.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, description):
+        self.description = description
+        self.error       = None
+        self._process    = None
+        self._state      = 'New'
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def slots(self):
+        return max(1, int(self.description.number_of_processes or 1))
+
+    # ------------------------------------------------------------------------
+    #
+    def start(self):
+        """Starts the subprocess in the CU's working directory. STDOUT and
+        STDERR go to files in the working directory.
+        """
+        cud = self.description
+        wd  = cud.working_directory
+
+        try:
+            os.makedirs(wd)
+        except OSError, ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+        env = dict(os.environ)
+        env.update(cud.environment or {})
+
+        # Arguments are passed the same way BigJob does it, i.e., through
+        # the shell.
+        command = " ".join([cud.executable] + list(cud.arguments or []))
+
+        stdout = open(os.path.join(wd, cud.output), 'w')
+        stderr = open(os.path.join(wd, cud.error), 'w')
+        try:
+            self._process = subprocess.Popen(command, shell=True, cwd=wd,
+                env=env, stdout=stdout, stderr=stderr, close_fds=True)
+        finally:
+            stdout.close()
+            stderr.close()
+
+        self._state = 'Running'
+
+    # ------------------------------------------------------------------------
+    #
+    def get_state(self):
+        if self._process is not None and self._state == 'Running':
+            returncode = self._process.poll()
+            if returncode is not None:
+                self._state = 'Done' if returncode == 0 else 'Failed'
+        return self._state
+
+    # ------------------------------------------------------------------------
+    #
+    def cancel(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        self._state = 'Canceled'
+
+
+# ----------------------------------------------------------------------------
+#
+class _LocalWorker(_PilotWorker):
+    """Runs CUs on the local machine in a pool of at most 'cores'
+    subprocess slots. A CU occupies 'number_of_processes' slots. CUs
+    that don't fit stay in state 'New' until slots become available.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, resource_obj, ready_to_transfer_input_queue,
+        ready_to_exec_q, ready_to_transfer_output_q, done_q, failed_q,
+        state_channel):
+        """DS
+        """
+        _PilotWorker.__init__(self, resource_obj, ready_to_transfer_input_queue,
+            ready_to_exec_q, ready_to_transfer_output_q, done_q, failed_q,
+            state_channel)
+
+        # Files are staged to 'remote_workdir_url' (file://localhost//...),
+        # which is rooted at '/', so the CUs have to use its path rather
+        # than 'workdir' (which might be relative to the current directory).
+        self._workdir = saga.Url(resource_obj['remote_workdir_url']).path
+
+        self._slots_total = max(1, int(resource_obj['cores']))
+        self._slots_used  = 0
+        self._queued_cus  = deque()
+        self._running_cus = []
+
+        logger.info("Starting LocalWorker with %d slots" % self._slots_total)
+
+    # ------------------------------------------------------------------------
+    #
+    def _launch_pilot(self):
+        """There is no pilot to launch. Makes sure the working directory
+        exists.
+        """
+        try:
+            os.makedirs(self._workdir)
+        except OSError, ex:
+            if ex.errno != errno.EEXIST:
+                self._res_obj['log'].append(str(ex))
+                self._set_state(constants.FAILED)
+                return
+
+        self._set_state(constants.PENDING)
+        self._set_state(constants.RUNNING)
+
+    # ------------------------------------------------------------------------
+    #
+    def _update_pilot(self):
+        """The local 'pilot' stays in state RUNNING.
+        """
+        pass
+
+    # ------------------------------------------------------------------------
+    #
+    def _state_poll_interval(self):
+        """Local state checks are cheap, so we poll more often.
+        """
+        return constants.LOCAL_POLL_INTERVAL
+
+    # ------------------------------------------------------------------------
+    #
+    def _poll_interval(self, task, now):
+        return constants.LOCAL_POLL_INTERVAL
+
+    # ------------------------------------------------------------------------
+    #
+    def _create_cu_description(self, task):
+        """Converts a task into a local CU description.
+        """
+        cu_description = _LocalComputeUnitDescription()
+        cu_description.executable          = task.executable
+        cu_description.arguments           = task.arguments
+        cu_description.environment         = task.environment
+        cu_description.working_directory   = os.path.join(self._workdir, task.dir_name)
+        cu_description.number_of_processes = task.cores
+
+        return cu_description
+
+    # ------------------------------------------------------------------------
+    #
+    def _submit_compute_units(self, tasks):
+        """Creates a CU for each task and starts as many as there are free
+        slots.
+        """
+        results = []
+        for task in tasks:
+            try:
+                cu = _LocalComputeUnit(self._create_cu_description(task))
+                if cu.slots > self._slots_total:
+                    raise Exception("CU requires %d slots but only %d are available." \
+                        % (cu.slots, self._slots_total))
+                self._queued_cus.append(cu)
+                results.append(cu)
+            except Exception, ex:
+                results.append(ex)
+
+        self._start_queued_cus()
+        return results
+
+    # ------------------------------------------------------------------------
+    #
+    def _update_task_state(self, task, new_cu_state):
+        """Adds the reason why a CU couldn't be started to the task log.
+        """
+        cu = task.get('cu')
+        if cu is not None and cu.error is not None:
+            task['task']._log.append(cu.error)
+            cu.error = None
+
+        _PilotWorker._update_task_state(self, task, new_cu_state)
+
+    # ------------------------------------------------------------------------
+    #
+    def _get_cu_states(self, cus):
+        """Reaps finished subprocesses, starts queued CUs in the free slots
+        and returns the CU states.
+        """
+        still_running = []
+        for cu in self._running_cus:
+            if cu.get_state() == 'Running':
+                still_running.append(cu)
+            else:
+                self._slots_used -= cu.slots
+        self._running_cus = still_running
+
+        self._start_queued_cus()
+
+        return _PilotWorker._get_cu_states(self, cus)
+
+    # ------------------------------------------------------------------------
+    #
+    def _start_queued_cus(self):
+        """Starts queued CUs (in order) as long as they fit.
+        """
+        while len(self._queued_cus) > 0:
+            cu = self._queued_cus[0]
+            if self._slots_used + cu.slots > self._slots_total:
+                break
+
+            self._queued_cus.popleft()
+            try:
+                cu.start()
+            except Exception, ex:
+                logger.error("Couldn't start local CU: %s" % str(ex))
+                cu.error  = "Couldn't start local CU: %s" % str(ex)
+                cu._state = 'Failed'
+                continue
+
+            self._slots_used += cu.slots
+            self._running_cus.append(cu)
+
+    # ------------------------------------------------------------------------
+    #
+    def _cancel_pilot(self):
+        """Kills all running subprocesses.
+        """
+        for cu in list(self._queued_cus) + self._running_cus:
+            cu.cancel()
+        self._queued_cus  = deque()
+        self._running_cus = []
+        self._slots_used  = 0
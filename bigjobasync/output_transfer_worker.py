@@ -11,15 +11,25 @@ __license__   = "MIT"
 
 import os 
 import saga
-import time
 import json
+import gzip
+import time
+import uuid
 import Queue
+import pipes
+import shutil
 import constants
 import multiprocessing
 
 from cgi import parse_qs
 
-from logger import logger
+from retry            import _with_retries
+from logger           import logger
+from task_spec        import _ActiveTask
+from remote_shell     import _RemoteShellCache
+from directory_pool   import _DirectoryPool
+from bulk_transfer    import _BulkTransfer
+from chunked_transfer import _ChunkedTransfer
 
 # ----------------------------------------------------------------------------
 #
@@ -27,46 +37,364 @@ class _OutputTransferWorker(multiprocessing.Process):
 
     # ------------------------------------------------------------------------
     #
-    def __init__(self, wid, ready_to_transfer_output_q, done_q, failed_q):
+    def __init__(self, wid, resource_obj, ready_to_transfer_output_q, done_q,
+                 failed_q, state_channel, progress=None):
         multiprocessing.Process.__init__(self)
         self.daemon = True
-        self._stop  = False
+        self._stop  = multiprocessing.Event()
+
+        self._resource_obj = resource_obj
 
         # All queue an OutputFileTransferWorker can access
         self._tasks_done_q = done_q
         self._tasks_failed_q = failed_q
         self._tasks_ready_to_transfer_output_q = ready_to_transfer_output_q
 
+        # Task state changes are published to the parent process
+        self._state_channel = state_channel
+
+        # Shared counter of processed tasks (used by the worker pool to
+        # measure the throughput), or None
+        self._progress = progress
+
+        # Directory handles and shells are kept per host. They are
+        # created in run(), i.e., in the worker process.
+        self._fs_pool = None
+        self._shells  = None
+        self._chunked = None
+        self._bulk    = None
+
         logger.info("Starting OutputTransferWorker %d using SAGA version %s" % (wid, saga.version))
 
 
     # ------------------------------------------------------------------------
     #
     def stop(self):
-        """DS
+        """Signals the worker to terminate. Can be called from the parent
+        process. Putting None (poison pill) into the queue has the same
+        effect, but only after all tasks before it have been processed.
         """
-        self._stop = True
+        self._stop.set()
 
     # ------------------------------------------------------------------------
     #
     def run(self):
         """DS
         """
-        while self._stop is False:
-            while True:
-                try:
-                    task = self._tasks_ready_to_transfer_output_q.get_nowait()
-                    # transfer_input_file tries to transfer the input files 
-                    # for a given task and puts it afterwards either in the 
-                    # 'ready_to_exec' or 'failed' queues. 
-                    self.transfer_output_file(task)
-                    #self._tasks_ready_to_exec_q.put(task)
-                    self._tasks_ready_to_transfer_output_q.task_done()
-
-                except Queue.Empty:
-                    break
-
-            time.sleep(1)
+        fs_pool = _DirectoryPool()
+        shells  = _RemoteShellCache()
+        self._open_session(fs_pool, shells)
+        try:
+            self._process_tasks()
+        finally:
+            shells.close()
+            fs_pool.close()
+
+    # ------------------------------------------------------------------------
+    #
+    def _open_session(self, fs_pool, shells):
+        """Sets up the per-process transfer state. 'fs_pool' and 'shells'
+        can be shared with other workers in the same process.
+        """
+        self._fs_pool = fs_pool
+        self._shells  = shells
+        self._chunked = _ChunkedTransfer(self._fs_pool, self._shells)
+        self._bulk    = _BulkTransfer(self._fs_pool, self._shells)
+
+    # ------------------------------------------------------------------------
+    #
+    def _count_progress(self):
+        if self._progress is not None:
+            with self._progress.get_lock():
+                self._progress.value += 1
+
+    # ------------------------------------------------------------------------
+    #
+    def _process_tasks(self):
+        """Processes tasks until the worker is stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                # block until there's a new task, but wake up every now
+                # and then to check the stop flag.
+                spec = self._tasks_ready_to_transfer_output_q.get(True, constants.TRANSFER_WORKER_TIMEOUT)
+            except Queue.Empty:
+                continue
+
+            if spec is None:
+                # poison pill: we are done.
+                self._tasks_ready_to_transfer_output_q.task_done()
+                break
+
+            self._process_task(spec)
+
+    # ------------------------------------------------------------------------
+    #
+    def _process_task(self, spec):
+        """Transfers the output files of a task and marks it as done in
+        the output queue.
+        """
+        if spec.state == constants.RUNNING:
+            # streaming sync of a task that is still running. This doesn't
+            # change the task state.
+            try:
+                self.sync_streaming_outputs(spec)
+            except Exception, ex:
+                logger.warning("Streaming output sync of task %s failed: %s" % (spec.name, str(ex)))
+            finally:
+                self._tasks_ready_to_transfer_output_q.task_done()
+                self._count_progress()
+            return
+
+        task = _ActiveTask(spec, self._state_channel)
+        try:
+            # transfer_output_file tries to transfer the output files
+            # for a given task and puts it afterwards into the next
+            # queue or the 'failed' queue.
+            self.transfer_output_file(task)
+        except Exception, ex:
+            logger.error("Unexpected error during output transfer: %s" % str(ex))
+            task._log.append(str(ex))
+            task._set_state(constants.FAILED)
+            self._tasks_failed_q.put(task.spec)
+        finally:
+            self._tasks_ready_to_transfer_output_q.task_done()
+            self._count_progress()
+
+    # ------------------------------------------------------------------------
+    #
+    def _is_large(self, directive, task_workdir_url, output_file_url, attempt=1):
+        """Returns True if the output file of a directive with 'chunked':
+        True should be transferred in chunks. Other directives don't pay
+        for the remote size lookup. Retries of files with more than one
+        chunk are always chunked, so that the next retry resumes where
+        this one stops.
+        """
+        if directive.get('chunked') is not True or constants.CHUNKED_TRANSFER_THRESHOLD is None:
+            return False
+        with self._fs_pool.directory(task_workdir_url) as root:
+            size = root.get_size(saga.Url(output_file_url).path)
+        return _ChunkedTransfer.applies_to(size) or \
+            (attempt > 1 and size > constants.CHUNKED_TRANSFER_CHUNK_SIZE)
+
+    # ------------------------------------------------------------------------
+    #
+    def _compress(self, directive):
+        """Returns True if the output file of 'directive' should be
+        transferred compressed.
+        """
+        if 'compress' in directive:
+            return directive['compress'] is True
+        return self._resource_obj.get('compress_outputs') is True
+
+    # ------------------------------------------------------------------------
+    #
+    def _fetch_compressed(self, task, output_file_url, local_file):
+        """Compresses the output file on the remote side, transfers it and
+        decompresses it into 'local_file'. Logs the compression ratio and
+        the estimated time saved.
+        """
+        remote_path = saga.Url(output_file_url).path
+        gz_url      = saga.Url(output_file_url)
+        gz_url.path = os.path.join(os.path.dirname(remote_path),
+            ".%s.%s.gz" % (os.path.basename(remote_path), uuid.uuid4()))
+        local_gz    = os.path.join(os.path.dirname(local_file),
+            ".%s.%s.gz" % (os.path.basename(local_file), uuid.uuid4()))
+        shell       = self._shells.get(output_file_url)
+
+        out = shell.run("{ gzip -%d -c %s > %s || { rm -f %s; false; }; } && wc -c < %s && wc -c < %s" % (
+            constants.OUTPUT_COMPRESSION_LEVEL, pipes.quote(remote_path), pipes.quote(gz_url.path),
+            pipes.quote(gz_url.path), pipes.quote(remote_path), pipes.quote(gz_url.path)))
+        raw_size, gz_size = [int(size) for size in out.split()]
+
+        try:
+            start = time.time()
+            if _ChunkedTransfer.applies_to(gz_size):
+                self._chunked.download(str(gz_url), local_gz, task._log)
+            else:
+                with self._fs_pool.directory(output_file_url) as root:
+                    root.copy(gz_url.path, "file://localhost//%s" % local_gz)
+            elapsed = time.time() - start
+
+            # decompress under a temporary name, so that a failed transfer
+            # doesn't leave a partial file behind
+            tmp_file = "%s.tmp" % local_gz
+            src = gzip.open(local_gz, 'rb')
+            try:
+                with open(tmp_file, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            finally:
+                src.close()
+            os.rename(tmp_file, local_file)
+        finally:
+            for path in [local_gz, "%s.tmp" % local_gz]:
+                if os.path.exists(path):
+                    os.remove(path)
+            try:
+                shell.run("rm -f %s" % pipes.quote(gz_url.path))
+            except Exception, ex:
+                logger.warning("Couldn't remove %s: %s" % (gz_url.path, str(ex)))
+
+        # the time the uncompressed file would have taken at the measured
+        # transfer rate
+        if elapsed > 0 and gz_size > 0:
+            saved = (raw_size - gz_size) * elapsed / gz_size
+        else:
+            saved = 0.0
+        task._log.append("Transferred output file %s compressed: %d -> %d bytes (ratio %.1f), %.1fs, about %.1fs saved" \
+            % (output_file_url, raw_size, gz_size, float(raw_size) / max(1, gz_size), elapsed, saved))
+
+    # ------------------------------------------------------------------------
+    #
+    def _local_output_path(self, destination_path):
+        """Returns the local path (file or directory) for a LOCAL output
+        destination.
+        """
+        if destination_path == '.':
+            return os.getcwd()
+        elif destination_path.startswith("/") is False:
+            return "%s/%s" % (os.getcwd(), destination_path)
+        else:
+            return destination_path
+
+    # ------------------------------------------------------------------------
+    #
+    def _fetch_if_changed(self, task_workdir_url, output_file_url, local_file, final, log=None):
+        """Fetches an output file unless the local copy has the same size
+        and modification time. Returns False if it was skipped. The local
+        copy gets the modification time of the remote file, so that a
+        file that is rewritten with the same size is still fetched again.
+        Files above the chunking threshold are fetched in chunks.
+
+        Streaming syncs (final=False) skip files that don't exist yet and
+        never replace a local copy with an older (smaller) one, in case a
+        later sync has overtaken them.
+        """
+        remote_path = saga.Url(output_file_url).path
+
+        with self._fs_pool.directory(task_workdir_url) as root:
+            if final is False and not root.exists(remote_path):
+                return False
+
+            size, mtime = self._shells.get(output_file_url).stat(pipes.quote(remote_path))
+            if os.path.exists(local_file) and os.path.getsize(local_file) == size \
+                and int(os.path.getmtime(local_file)) == mtime:
+                return False
+
+            # fetch into a temporary file, so that the local copy is always
+            # a complete snapshot
+            if _ChunkedTransfer.applies_to(size):
+                # a fixed name, so that a retry resumes from the chunks
+                # that have already been fetched
+                tmp_file = os.path.join(os.path.dirname(local_file),
+                    ".%s.chunked" % os.path.basename(local_file))
+            else:
+                tmp_file = os.path.join(os.path.dirname(local_file),
+                    ".%s.%s" % (os.path.basename(local_file), uuid.uuid4()))
+            try:
+                if _ChunkedTransfer.applies_to(size):
+                    self._chunked.download(output_file_url, tmp_file, log if log is not None else [])
+                else:
+                    root.copy(output_file_url, "file://localhost//%s" % tmp_file)
+            except Exception:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+
+        if final is False and os.path.exists(local_file) and \
+            os.path.getsize(local_file) > os.path.getsize(tmp_file):
+            os.remove(tmp_file)
+        else:
+            # the mtime from before the copy: if the file has been written
+            # to during the copy, the next sync fetches it again
+            os.utime(tmp_file, (time.time(), mtime))
+            os.rename(tmp_file, local_file)
+
+        return True
+
+    # ------------------------------------------------------------------------
+    #
+    def sync_streaming_outputs(self, spec):
+        """Fetches the LOCAL output files with 'stream': True of a running
+        task if they have changed since the last sync.
+        """
+        task_workdir_url = saga.Url("%s/%s" % (spec.remote_workdir_url, spec.dir_name))
+        task_workdir_url.path = os.path.abspath(task_workdir_url.path)
+
+        for directive in spec.output:
+            if directive.get('stream') is not True or directive['destination'] != constants.LOCAL \
+                or _BulkTransfer.applies_to(directive):
+                continue
+
+            origin_path = directive['origin_path']
+            local_file  = self._local_output_path(directive['destination_path'])
+            if os.path.isdir(local_file):
+                local_file = os.path.join(local_file, os.path.basename(origin_path))
+
+            output_file_url = "%s/%s" % (task_workdir_url, origin_path)
+            if self._fetch_if_changed(task_workdir_url, output_file_url, local_file, final=False):
+                logger.info("Synced streaming output file %s of task %s" % (origin_path, spec.name))
+
+    # ------------------------------------------------------------------------
+    #
+    def _transfer_output(self, task, directive, task_workdir_url, attempt):
+        """Transfers the output file of one directive.
+        """
+        origin_path      = directive['origin_path']
+        destination_path = directive['destination_path']
+        output_file_url  = "%s/%s" % (task_workdir_url, origin_path)
+
+        if _BulkTransfer.applies_to(directive):
+            # glob patterns and directories: 'destination_path' is the
+            # directory the files are copied into
+            if directive['destination'] == constants.LOCAL:
+                self._bulk.download(origin_path, task_workdir_url,
+                    self._local_output_path(destination_path), task._log)
+            else:
+                if "://" in destination_path:
+                    raise Exception("Glob and recursive directives need a path, not a URL: '%s'" % destination_path)
+                self._bulk.remote(origin_path, task_workdir_url, destination_path,
+                    constants.COPY, task._log)
+            return
+
+        if directive['destination'] == constants.LOCAL:
+            # copying REMOTE -> LOCAL
+            local_path = self._local_output_path(destination_path)
+
+            local_filename = "file://localhost//%s" % local_path
+            if directive.get('stream') is True:
+                # final delta sync. The file has been fetched while
+                # the task was running and might be up to date.
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, os.path.basename(origin_path))
+                if not self._fetch_if_changed(task_workdir_url, output_file_url, local_path, final=True, log=task._log):
+                    task._log.append("Output file %s hasn't changed since the last streaming sync" % output_file_url)
+                    return
+            elif self._compress(directive) is True:
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, os.path.basename(origin_path))
+                self._fetch_compressed(task, output_file_url, local_path)
+            elif self._is_large(directive, task_workdir_url, output_file_url, attempt):
+                # large files go in parallel chunks
+                if os.path.isdir(local_path):
+                    local_path = os.path.join(local_path, os.path.basename(origin_path))
+                self._chunked.download(output_file_url, local_path, task._log)
+            else:
+                with self._fs_pool.directory(task_workdir_url) as root:
+                    root.copy(output_file_url, local_filename)
+            task._log.append("Copying output file %s to %s" % (output_file_url, local_filename))
+
+        else:
+            # copying REMOTE -> REMOTE. The pooled handle points to
+            # the root directory, so relative paths are resolved
+            # against the task's working directory.
+            if "://" in destination_path or destination_path.startswith("/"):
+                remote_path = destination_path
+            else:
+                remote_path = "%s/%s" % (task_workdir_url.path, destination_path)
+            with self._fs_pool.directory(task_workdir_url) as root:
+                root.copy(output_file_url, remote_path)
+            task._log.append("Copying output file %s to %s" % (output_file_url, destination_path))
 
     # ------------------------------------------------------------------------
     #
@@ -83,15 +411,13 @@ class _OutputTransferWorker(multiprocessing.Process):
         try:
             # create working directories for tasks based on the task uid
 
-            task_workdir_url = saga.Url("%s/%s" % (task._remote_workdir_url, task.dir_name))
+            task_workdir_url = saga.Url("%s/%s" % (task.remote_workdir_url, task.dir_name))
             task_workdir_url.path = os.path.abspath(task_workdir_url.path)
 
-            task_workdir = saga.filesystem.Directory(task_workdir_url)
-
         except Exception, ex:
             task._log.append(str(ex))
             task._set_state(constants.FAILED)
-            self._tasks_failed_q.put(task)
+            self._tasks_failed_q.put(task.spec)
             return
 
                 # Next we can take care of the file transfers
@@ -107,47 +433,27 @@ class _OutputTransferWorker(multiprocessing.Process):
 
             try: 
                 output_file_url = "%s/%s" % (task_workdir_url, origin_path)
-                
-                if destination == constants.LOCAL:
-                    # copying REMOTE -> LOCAL
-                    if destination_path == '.':
-                        local_path = os.getcwd()
-                    else:
-                        if destination_path.startswith("/") is False:
-                            local_path = "%s/%s" % (os.getcwd(), destination_path)
-                        else:
-                            local_path = destination_path
-
-                    local_filename = "file://localhost//%s" % local_path
-                    task_workdir.copy(output_file_url, local_filename)
-                    task._log.append("Copying output file %s to %s" % (output_file_url, local_filename))
-
-                elif destination == constants.REMOTE:
-                    # copying REMOTE -> REMOTE                    
-                    task_workdir.copy(output_file_url, destination_path)
-                    task._log.append("Copying output file %s to %s" % (output_file_url, destination_path))
 
-                else:
+                if destination not in [constants.LOCAL, constants.REMOTE]:
                     raise Exception("Invalid paramater for output file destination: %s" % destination)
 
+                _with_retries(
+                    lambda attempt: self._transfer_output(task, directive, task_workdir_url, attempt),
+                    task._log, "transfer of output file %s" % output_file_url,
+                    directive.get('retries'))
+
             except Exception, ex:
                 task._log.append(str(ex))
                 task._set_state(constants.FAILED)
-                self._tasks_failed_q.put(task)
+                self._tasks_failed_q.put(task.spec)
                 return
 
-        try:
-            task_workdir.close()
-        except Exception, ex:
-            task._log.append(str(ex))
-            # don't propagate a 'FAILED' state here
-
         # Set state to 'Pending'. From here on, BigJob will
         # determine the state of this task.
 
         if prev_state == constants.FAILED:
             task._set_state(constants.FAILED)
-            self._tasks_failed_q.put(task)
+            self._tasks_failed_q.put(task.spec)
         else:
             task._set_state(constants.DONE)
-            self._tasks_done_q.put(task)
+            self._tasks_done_q.put(task.spec)
@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+"""Implements the scheduling loop shared by the BigJob and SAGA-Pilot
+based resource and task management multiprocessing.Processes.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import abc
+import time
+import Queue
+import constants
+import multiprocessing
+
+import task_table
+
+from logger          import logger
+from task_table      import _TaskTable
+from task_spec       import _ActiveTask
+from slot_accountant import _SlotAccountant
+
+# ----------------------------------------------------------------------------
+#
+class _PilotWorker(multiprocessing.Process):
+    """Base class for the pilot workers.
+
+    The main loop blocks on the 'ready to execute' queue until either new
+    tasks arrive or the state poll timer (constants.STATE_POLL_INTERVAL)
+    fires. Backend specific operations (launching the pilot, submitting
+    CUs, etc.) are implemented by the subclasses.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    # Whether failed tasks are handed to the output transfer workers
+    # (so their output can be inspected) or directly to the failed queue.
+    _TRANSFER_OUTPUT_IF_FAILED = True
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, resource_obj, ready_to_transfer_input_queue,
+        ready_to_exec_q, ready_to_transfer_output_q, done_q, failed_q,
+        state_channel):
+        """DS
+        """
+
+        # Multiprocessing stuff. The stop flag needs to be visible in the
+        # child process, hence a multiprocessing.Event.
+        multiprocessing.Process.__init__(self)
+        self.daemon = True
+        self._stop  = multiprocessing.Event()
+
+        # The resource object binds the worker to the public API & callbacks
+        self._res_obj = resource_obj
+
+        # Pilot handles
+        self._pilot_job = None
+        self._pilot_service = None
+
+        # Physical tasks, keyed by task uid and bucketed by state
+        self._physical_tasks = _TaskTable()
+
+        # Keeps track of the free cores on the pilot
+        self._slots = _SlotAccountant(resource_obj['cores'],
+            constants.ADMISSION_POLICY)
+
+        # All queue an InputFileTransferWorker can access
+        self._tasks_done_q = done_q
+        self._tasks_failed_q = failed_q
+        self._tasks_ready_to_exec_q = ready_to_exec_q
+        self._tasks_ready_to_transfer_output_q = ready_to_transfer_output_q
+        self._tasks_ready_to_transfer_input_q = ready_to_transfer_input_queue
+
+        # Task state changes are published to the parent process
+        self._state_channel = state_channel
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def log(self):
+        """Returns the resource log.
+        """
+        return self._res_obj['log']
+
+    # ------------------------------------------------------------------------
+    #
+    def stop(self):
+        """Signals the main loop to terminate. Can be called from
+        the parent process.
+        """
+        self._stop.set()
+
+    # ------------------------------------------------------------------------
+    #
+    def run(self):
+        """DS
+        """
+        start_time = time.time()
+        # First of all, the worker needs to launch a pilot on which it
+        # can schedule tasks that come in via the _tasks_ready_to_exec_q
+        # queue.
+        self._launch_pilot()
+
+        next_poll = time.time()
+
+        while not self._stop.is_set():
+
+            # Sometimes pilot jobs have the tendency not terminate
+            # properly. in this case, we monitor the runtime and terminate
+            # manually after the rumtime (+ some grace period) has expired
+            if time.time() - start_time >= (self._res_obj['runtime'] + 1)  * 60:
+                self.stop()
+                continue
+
+            # Block on the 'ready to execute queue' until either new tasks
+            # arrive or it is time for the next state poll. Everything that
+            # is in the queue is picked up at once.
+            self._wait_for_tasks(timeout=max(0.0, next_poll - time.time()))
+
+            if time.time() >= next_poll:
+                # Periodically, we check the status of our pilot object,
+                # translate the state and call the state change callbacks.
+                if self._res_obj['state'] not in [constants.DONE, constants.FAILED]:
+                    # Obviously, we only do this if the object is not in a
+                    # terminal state, i.e., 'Done' or 'Failed'.
+                    self._update_pilot()
+
+                # Only tasks with a CU can change their state.
+                self._update_task_states()
+
+                # Fetch 'stream' outputs of running tasks
+                self._stream_outputs()
+
+                next_poll = time.time() + self._state_poll_interval()
+
+            # Submit new tasks and push finished tasks into the
+            # appropriate queues.
+            self._process_tasks()
+
+        # once we have left the main loop, we can cancel everything.
+        self._cancel_pilot()
+
+    # ------------------------------------------------------------------------
+    #
+    def _wait_for_tasks(self, timeout):
+        """Waits up to 'timeout' seconds for new tasks in the 'ready to
+        execute queue' and drains it.
+        """
+        try:
+            spec = self._tasks_ready_to_exec_q.get(True, timeout)
+        except Queue.Empty:
+            return
+
+        while True:
+            # New task ready to execute. Add to internal task table
+            task = _ActiveTask(spec, self._state_channel)
+            pt = self._physical_tasks.add(task)
+            pt['state_since'] = time.time()
+            pt['next_poll']   = 0
+            try:
+                spec = self._tasks_ready_to_exec_q.get_nowait()
+            except Queue.Empty:
+                break
+
+    # ------------------------------------------------------------------------
+    #
+    def _process_tasks(self):
+        """Schedules waiting tasks and removes finished tasks from the
+        task table.
+        """
+        waiting = self._physical_tasks.bucket(task_table.WAITING)
+        if len(waiting) > 0:
+            # Higher priority tasks first. The sort is stable, so tasks
+            # of equal priority keep the order of the queue.
+            waiting.sort(key=lambda pt: -pt['task'].priority)
+
+            # Only submit as many tasks as there are free cores.
+            admitted, rejected = self._slots.admit(waiting)
+
+            for pt in rejected:
+                pt['task']._log.append("Task requires %s cores but the pilot only has %s." \
+                    % (pt['task'].cores, self._slots.total))
+                pt['task']._set_state(constants.FAILED)
+                self._physical_tasks.update(pt)
+
+            if len(admitted) > 0:
+                self._schedule_cus(admitted)
+
+        for pt in self._physical_tasks.bucket(task_table.FINISHED):
+
+            if pt['task'].state in [constants.WAITING_FOR_OUTPUT_TRANSFER]:
+                self._tasks_ready_to_transfer_output_q.put(pt['task'].spec)
+
+            elif pt['task'].state in [constants.DONE]:
+                # Task is done, i.e., there are no output files to
+                # transfer. Remove it.
+                self._tasks_done_q.put(pt['task'].spec)
+
+            elif self._TRANSFER_OUTPUT_IF_FAILED is True:
+                # Task has failed, so there's not much we can do except for
+                # removing it from the table. We transfer task output even
+                # if the task has failed.
+                self._tasks_ready_to_transfer_output_q.put(pt['task'].spec)
+
+            else:
+                self._tasks_failed_q.put(pt['task'].spec)
+
+            self._slots.release(pt['task'].uid)
+            self._physical_tasks.remove(pt)
+            self._tasks_ready_to_exec_q.task_done()
+
+    # ------------------------------------------------------------------------
+    #
+    def _update_task_states(self):
+        """Fetches the states of all CUs that are due for polling and
+        updates the tasks accordingly.
+        """
+        now = time.time()
+
+        due = [pt for pt in self._physical_tasks.bucket(task_table.PENDING,
+                                                        task_table.RUNNING)
+               if pt['next_poll'] <= now]
+        if len(due) == 0:
+            return
+
+        try:
+            cu_states = self._get_cu_states([pt['cu'] for pt in due])
+        except Exception, ex:
+            cu_states = [ex] * len(due)
+
+        for pt, cu_state in zip(due, cu_states):
+            old_state = pt['task'].state
+            self._update_task_state(pt, cu_state)
+
+            if pt['task'].state != old_state:
+                pt['state_since'] = now
+            pt['next_poll'] = now + self._poll_interval(pt, now)
+
+            self._physical_tasks.update(pt)
+
+    # ------------------------------------------------------------------------
+    #
+    def _stream_outputs(self):
+        """Every STREAM_SYNC_INTERVAL seconds, hands running tasks with
+        'stream' output directives to the output transfer workers, which
+        fetch the files that have changed. The task state doesn't change.
+        """
+        now = time.time()
+
+        for pt in self._physical_tasks.bucket(task_table.RUNNING):
+            if 'next_stream' not in pt:
+                if not any([d.get('stream') is True for d in pt['task'].output]):
+                    pt['next_stream'] = None
+                else:
+                    pt['next_stream'] = now + constants.STREAM_SYNC_INTERVAL
+
+            if pt['next_stream'] is None or pt['next_stream'] > now:
+                continue
+
+            self._tasks_ready_to_transfer_output_q.put(pt['task'].spec)
+            pt['next_stream'] = now + constants.STREAM_SYNC_INTERVAL
+
+    # ------------------------------------------------------------------------
+    #
+    def _state_poll_interval(self):
+        """Returns the interval of the state poll timer.
+        """
+        return constants.STATE_POLL_INTERVAL
+
+    # ------------------------------------------------------------------------
+    #
+    def _poll_interval(self, task, now):
+        """Returns the time until a task needs to be polled again. The
+        interval grows with the time the task has spent in its current
+        state, bounded by constants.CU_POLL_INTERVALS.
+        """
+        min_interval, max_interval = constants.CU_POLL_INTERVALS.get(
+            task['task'].state, (constants.STATE_POLL_INTERVAL,
+                                 constants.STATE_POLL_INTERVAL))
+
+        interval = (now - task['state_since']) * constants.CU_POLL_BACKOFF
+        return min(max(interval, min_interval), max_interval)
+
+    # ------------------------------------------------------------------------
+    #
+    def _get_cu_states(self, cus):
+        """Returns the states of a list of CUs. Each element is either a
+        state string or the exception that occured while fetching it.
+
+        The default implementation calls get_state() once per CU, i.e.,
+        one round trip per CU for BigJob and SAGA-Pilot. Backends that can
+        fetch many CU states at once can override it.
+        """
+        cu_states = []
+        for cu in cus:
+            try:
+                cu_states.append(cu.get_state())
+            except Exception, ex:
+                cu_states.append(ex)
+        return cu_states
+
+    # ------------------------------------------------------------------------
+    #
+    def _update_task_state(self, task, new_cu_state):
+        """Translates a CU state into a task state.
+        """
+        if isinstance(new_cu_state, Exception):
+            task['task']._log.append(str(new_cu_state))
+            task['task']._set_state(constants.FAILED)
+            return
+
+        new_cu_state = new_cu_state.lower()
+
+        if new_cu_state in ['unknown', 'new']:
+            translated_state = constants.PENDING
+        elif new_cu_state == 'running':
+            translated_state = constants.RUNNING
+        elif new_cu_state == 'done':
+            if len(task['task'].output) > 0:
+                translated_state = constants.WAITING_FOR_OUTPUT_TRANSFER
+            else:
+                translated_state = constants.DONE
+        else:
+            error_msg = "Pilot returned CU state '%s'" % new_cu_state
+            task['task']._log.append(error_msg)
+            translated_state = constants.FAILED
+
+        task['task']._set_state(translated_state)
+
+    # ------------------------------------------------------------------------
+    #
+    def _set_state(self, new_state):
+        """Sets the resource state and calls the resource callbacks.
+        """
+        # do nothing if existing and new state are identical
+        if self._res_obj['state'] == new_state:
+            return
+
+        old_state = self._res_obj['state']
+        self._res_obj['state'] = new_state
+
+        for callback in self._res_obj['callbacks']:
+            callback(self, old_state, new_state)
+
+    # ------------------------------------------------------------------------
+    #
+    def _schedule_cus(self, entries):
+        """Submits the tasks of a list of task table entries to the pilot,
+        in windows of at most constants.SUBMISSION_WINDOW tasks. Task states
+        are set according to the per-task results.
+        """
+        window_size = constants.SUBMISSION_WINDOW
+
+        for i in range(0, len(entries), window_size):
+            window = entries[i:i+window_size]
+            tasks  = [pt['task'] for pt in window]
+
+            try:
+                results = self._submit_compute_units(tasks)
+            except Exception, ex:
+                results = [ex] * len(tasks)
+
+            failed = 0
+            for pt, result in zip(window, results):
+                if isinstance(result, Exception):
+                    pt['task']._log.append(str(result))
+                    pt['task']._set_state(constants.FAILED)
+                    failed += 1
+                else:
+                    pt['cu'] = result
+                    pt['task']._set_state(constants.PENDING)
+                    pt['state_since'] = time.time()
+                    pt['next_poll']   = pt['state_since'] + \
+                        self._poll_interval(pt, pt['state_since'])
+                self._physical_tasks.update(pt)
+
+            logger.debug("Submitted a window of %d CUs (%d failed)." \
+                % (len(window), failed))
+
+    # ------------------------------------------------------------------------
+    #
+    def _submit_compute_units(self, tasks):
+        """Submits a list of tasks as CUs. Returns a list with either the
+        CU or the exception for each task.
+
+        Neither BigJob nor the SAGA-Pilot worker (which talks to the BigJob
+        pilot API) have a bulk submission call, so this costs one round
+        trip per CU. Backends that can do better override it.
+        """
+        results = []
+        for task in tasks:
+            try:
+                description = self._create_cu_description(task)
+                results.append(self._pilot_job.submit_compute_unit(description))
+            except Exception, ex:
+                results.append(ex)
+        return results
+
+    # ------------------------------------------------------------------------
+    #
+    @abc.abstractmethod
+    def _launch_pilot(self):
+        """Starts a pilot on the target machine. Implemented by subclasses.
+        """
+
+    # ------------------------------------------------------------------------
+    #
+    @abc.abstractmethod
+    def _update_pilot(self):
+        """Updates the resource state. Implemented by subclasses.
+        """
+
+    # ------------------------------------------------------------------------
+    #
+    @abc.abstractmethod
+    def _create_cu_description(self, task):
+        """Converts a task into a CU description. Implemented by subclasses.
+        """
+
+    # ------------------------------------------------------------------------
+    #
+    @abc.abstractmethod
+    def _cancel_pilot(self):
+        """Cancels the pilot. Implemented by subclasses.
+        """
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""Implements a thin wrapper around saga-python's PTYShell that is used
+to run (bulk) commands on the remote file system, e.g., to unpack
+archives or to create many directories at once.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import saga
+import threading
+import constants
+import saga.utils.pty_shell as sups
+
+from logger         import logger
+from directory_pool import _DirectoryPool
+
+# URL schemes that refer to the local file system
+_LOCAL_SCHEMES = ['file', 'local']
+
+# ----------------------------------------------------------------------------
+#
+class _RemoteShell(object):
+    """A shell on the host of a file system URL. 'file://' URLs map to a
+    local shell, everything else (sftp://, ssh://, ...) to ssh.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, url):
+        """Opens a shell on the host 'url' points to.
+        """
+        _, root = _DirectoryPool.root_url(url)
+
+        shell_url = saga.Url(root)
+        if shell_url.scheme in _LOCAL_SCHEMES:
+            shell_url.scheme = 'fork'
+            shell_url.host   = 'localhost'
+        else:
+            shell_url.scheme = 'ssh'
+
+        self._url    = str(shell_url)
+        self._lock   = threading.Lock()
+        self._broken = False
+        self._shell  = sups.PTYShell(shell_url)
+
+        logger.info("Opened remote shell on %s" % self._url)
+
+    # ------------------------------------------------------------------------
+    #
+    def run(self, command):
+        """Runs 'command' and returns its output. Raises an exception if
+        the command returns a non-zero exit code.
+        """
+        with self._lock:
+            try:
+                ret, out, _ = self._shell.run_sync(command)
+            except Exception:
+                # most likely the connection is gone
+                self._broken = True
+                raise
+
+        if ret != 0:
+            raise Exception("Command '%s' on %s failed with exit code %s: %s" \
+                % (command, self._url, ret, out.strip()))
+        return out
+
+    # ------------------------------------------------------------------------
+    #
+    def run_args(self, command, args):
+        """Runs 'command' with the (already quoted) arguments 'args', like
+        xargs: as few times as possible, but without exceeding
+        REMOTE_SHELL_MAX_COMMAND_LENGTH. Returns the combined output.
+        """
+        out   = []
+        batch = []
+        for arg in args:
+            if len(batch) > 0 and len(command) + sum([len(a) + 1 for a in batch]) \
+                + len(arg) + 1 > constants.REMOTE_SHELL_MAX_COMMAND_LENGTH:
+                out.append(self.run("%s %s" % (command, " ".join(batch))))
+                batch = []
+            batch.append(arg)
+        if len(batch) > 0:
+            out.append(self.run("%s %s" % (command, " ".join(batch))))
+        return "".join(out)
+
+    # ------------------------------------------------------------------------
+    #
+    def run_script(self, commands):
+        """Runs a list of commands. Consecutive commands are joined with
+        '; ' into as few command lines as possible without exceeding
+        REMOTE_SHELL_MAX_COMMAND_LENGTH (a single longer command is sent
+        on its own). Each line needs to exit with 0. Returns the combined
+        output.
+        """
+        out   = []
+        batch = []
+        for command in commands:
+            if len(batch) > 0 and sum([len(c) + 2 for c in batch]) + len(command) \
+                > constants.REMOTE_SHELL_MAX_COMMAND_LENGTH:
+                out.append(self.run("; ".join(batch)))
+                batch = []
+            batch.append(command)
+        if len(batch) > 0:
+            out.append(self.run("; ".join(batch)))
+        return "".join(out)
+
+    # ------------------------------------------------------------------------
+    #
+    def stat(self, path):
+        """Returns (size, mtime) of the (already quoted) remote 'path'.
+        Works with GNU and BSD stat.
+        """
+        out = self.run("stat -c '%%s %%Y' %s 2>/dev/null || stat -f '%%z %%m' %s" % (path, path))
+        size, mtime = out.split()[-2:]
+        return int(size), int(mtime)
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def broken(self):
+        return self._broken
+
+    # ------------------------------------------------------------------------
+    #
+    def close(self):
+        try:
+            self._shell.finalize(True)
+        except Exception, ex:
+            logger.debug("Couldn't close remote shell: %s" % str(ex))
+
+
+# ----------------------------------------------------------------------------
+#
+class _RemoteShellCache(object):
+    """Keeps one _RemoteShell per host. Like the directory pool, it needs
+    to be created in the process that uses it.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self):
+        self._lock   = threading.Lock()
+        self._shells = {}   # key -> shell
+
+    # ------------------------------------------------------------------------
+    #
+    def get(self, url):
+        """Returns the shell for the host 'url' points to.
+        """
+        key, _ = _DirectoryPool.root_url(url)
+        with self._lock:
+            shell = self._shells.get(key)
+            if shell is None or shell.broken:
+                shell = _RemoteShell(url)
+                self._shells[key] = shell
+            return shell
+
+    # ------------------------------------------------------------------------
+    #
+    def close(self):
+        """Closes all shells.
+        """
+        with self._lock:
+            shells = self._shells.values()
+            self._shells = {}
+
+        for shell in shells:
+            shell.close()
@@ -10,9 +10,10 @@ __license__   = "MIT"
 
 import time
 import math
-import pilot
+import zlib
 import saga
 import Queue
+import pipes
 import threading
 import multiprocessing 
 
@@ -20,8 +21,17 @@ import constants
 
 from logger import logger
 
+from task_queue             import _TaskQueueManager
+from task_spec              import _TaskSpec
+from input_cache            import _InputCacheIndex
+from dag_scheduler          import _DAGScheduler
+from state_channel          import _StateChannel, _StateDispatcher
+from remote_shell           import _RemoteShell
+from scratch_gc             import _ScratchCollector
 from input_transfer_worker  import _InputTransferWorker
 from output_transfer_worker import _OutputTransferWorker
+from worker_pool            import _TransferWorkerPool
+from transfer_engine        import _TransferEngine
 
 
 # ----------------------------------------------------------------------------
@@ -31,8 +41,61 @@ class Resource(threading.Thread):
     # ------------------------------------------------------------------------
     #
     def __init__(self, name, resource, runtime, cores, workdir, 
-        username=None, project_id=None, queue=constants.DEFAULT):
+        username=None, project_id=None, queue=constants.DEFAULT,
+        fair_share=False, backend=constants.DEFAULT, bundle_inputs=False,
+        cache_inputs=False, transfer_manifest=None,
+        transfer_engine=constants.PROCESS_POOL, compress_outputs=False,
+        batch_remote_inputs=False, bulk_create_workdirs=False,
+        workdir_shards=None, scratch_gc=None, scratch_gc_keep_failed=True):
         """Le Constructeur creates a resource new instance.
+
+        If fair_share=True, tasks of equal priority are interleaved
+        between task groups (see Task 'group') at every stage.
+
+        'backend' is one of BIGJOB, SAGA_PILOT or LOCALHOST. The default
+        is the 'backend' entry of the resource dictionary or, if there
+        is none, BIGJOB (SAGA_PILOT if USE_SAGA_PILOT is set).
+
+        If bundle_inputs=True, the LOCAL COPY input files of all tasks
+        that are waiting for input transfer are packed into one archive,
+        transferred at once and unpacked on the remote side.
+
+        If cache_inputs=True, LOCAL COPY input files are uploaded only
+        once into a content-addressed cache in the remote working
+        directory and linked into the task directories. Tasks must not
+        modify these files. Takes precedence over bundle_inputs.
+
+        'transfer_manifest' is the path of a local file in which uploads
+        of LOCAL COPY input files are recorded. Files that haven't changed
+        since an earlier upload (also in an earlier run) are copied on the
+        remote side instead of being uploaded again.
+
+        'transfer_engine' is either PROCESS_POOL (autoscaling pools of
+        transfer worker processes, one task per process at a time) or
+        THREAD_POOL (one process that runs many transfers concurrently in
+        threads, with a limit per remote host).
+
+        If compress_outputs=True, LOCAL output files are compressed on the
+        remote side, transferred and decompressed locally. Output
+        directives can override this with 'compress': True / False.
+
+        If batch_remote_inputs=True, the REMOTE and task output COPY / LINK
+        input directives of all tasks that are waiting for input transfer
+        are run as one remote script instead of one operation each.
+
+        If bulk_create_workdirs=True, schedule_tasks() creates the working
+        directories of all scheduled tasks with a few bulk 'mkdir'
+        commands instead of one remote operation per task. If
+        'workdir_shards' is set, the task working directories are spread
+        over that many subdirectories of the remote working directory.
+
+        'scratch_gc' is None (keep everything), DELETE or ARCHIVE. With
+        DELETE, the remote working directories of finished tasks are
+        removed in the background once their output files have been
+        transferred and no other task uses them as input. With ARCHIVE,
+        they are packed into SCRATCH_GC_ARCHIVE_DIR first. If
+        scratch_gc_keep_failed=True, directories of failed tasks are
+        kept.
         """
         threading.Thread.__init__(self)
         self.daemon     = True
@@ -44,31 +107,53 @@ class Resource(threading.Thread):
             cores = math.ceil(float(cores)/resource["core_increment"]) * resource["core_increment"]
             logger.info("Rounding up allocation to nearest core increment: %s." % (cores))
 
-        self._resource_obj                       = {}
-        self._resource_obj['log']                = []
-        self._resource_obj['callbacks']          = []
-        self._resource_obj['state']              = constants.NEW
-        self._resource_obj['name']               = name
-        self._resource_obj['username']           = username 
-        self._resource_obj['resource']           = resource
-        self._resource_obj['workdir']            = workdir
-        self._resource_obj['runtime']            = runtime
-        self._resource_obj['cores']              = cores
-        self._resource_obj['project_id']         = project_id
-        self._resource_obj['queue']              = queue
+        self._resource_obj                         = {}
+        self._resource_obj['log']                  = []
+        self._resource_obj['callbacks']            = []
+        self._resource_obj['state']                = constants.NEW
+        self._resource_obj['name']                 = name
+        self._resource_obj['username']             = username 
+        self._resource_obj['resource']             = resource
+        self._resource_obj['workdir']              = workdir
+        self._resource_obj['runtime']              = runtime
+        self._resource_obj['cores']                = cores
+        self._resource_obj['project_id']           = project_id
+        self._resource_obj['queue']                = queue
+        self._resource_obj['fair_share']           = fair_share
+        self._resource_obj['bundle_inputs']        = bundle_inputs
+        self._resource_obj['cache_inputs']         = cache_inputs
+        self._resource_obj['transfer_manifest']    = transfer_manifest
+        self._resource_obj['compress_outputs']     = compress_outputs
+        self._resource_obj['batch_remote_inputs']  = batch_remote_inputs
+        self._resource_obj['bulk_create_workdirs'] = bulk_create_workdirs
+        self._resource_obj['workdir_shards']       = workdir_shards
+        self._resource_obj['scratch_gc']           = scratch_gc
+
+        if backend == constants.DEFAULT:
+            from bigjobasync import USE_SAGA_PILOT
+            if 'backend' in resource:
+                backend = resource['backend']
+            elif USE_SAGA_PILOT is True:
+                backend = constants.SAGA_PILOT
+            else:
+                backend = constants.BIGJOB
+        self._resource_obj['backend']              = backend
 
         # make sure the backends we need are avaialbe 
-        from bigjobasync import USE_SAGA_PILOT
-        if USE_SAGA_PILOT is True:
+        if backend == constants.LOCALHOST:
+            pass
+        elif backend == constants.SAGA_PILOT:
             try: 
                 import sinon
             except ImportError:
                 raise Exception("Couldn't find SAGA-Pilot. Please install first via 'pip install --upgrade -e git://github.com/saga-project/saga-pilot.git@master#egg=saga-pilot'.")
-        else:
+        elif backend == constants.BIGJOB:
             try:
                 import pilot
             except ImportError:
                 raise Exception("Couldn't find BigJob. Please install first via 'pip install --upgrade bigjob'.")
+        else:
+            raise Exception("Unknown backend '%s'." % backend)
 
         # make sure we have at least version0.9.16 of saga-python
         if saga.version < "0.10":
@@ -83,36 +168,98 @@ class Resource(threading.Thread):
 
         self._terminate_on_empty_queue = False
 
-        self._ready_to_transfer_input_queue = multiprocessing.JoinableQueue()
-        self._ready_to_execute_queue = multiprocessing.JoinableQueue()
-        self._ready_to_transfer_output_queue = multiprocessing.JoinableQueue()
+        # The stage queues return tasks by priority (and fair-share). They
+        # live in a manager process that is shared by all workers.
+        self._queue_manager = _TaskQueueManager()
+        self._queue_manager.start()
+
+        self._ready_to_transfer_input_queue = self._queue_manager.TaskQueue(fair_share)
+        self._ready_to_execute_queue = self._queue_manager.TaskQueue(fair_share)
+        self._ready_to_transfer_output_queue = self._queue_manager.TaskQueue(fair_share)
         self._done_queue = multiprocessing.JoinableQueue()
         self._failed_queue = multiprocessing.JoinableQueue()
 
-        self._iftws = []
-        for x in range(0, constants.MAX_INPUT_TRANSFER_WORKERS):
-            iftw = _InputTransferWorker(
-                wid=x+1,
-                ready_to_transfer_input_q=self._ready_to_transfer_input_queue,
-                ready_to_exec_q=self._ready_to_execute_queue,
-                done_q=self._done_queue,
-                failed_q=self._failed_queue,
-            )
-            iftw.start()
-            self._iftws.append(iftw)
+        # The input cache index makes sure that transfer workers don't
+        # upload the same file concurrently.
+        if cache_inputs is True:
+            self._input_cache_index = self._queue_manager.InputCacheIndex()
+        else:
+            self._input_cache_index = None
+
+        # Task state changes in the worker processes are sent back through
+        # the state channel and applied to the original Task objects by
+        # the dispatcher thread.
+        self._state_channel = _StateChannel()
+        self._state_dispatcher = _StateDispatcher(self._state_channel,
+            state_cb=self._task_state_changed)
+        self._state_dispatcher.start()
+
+        # The DAG scheduler holds back tasks until their dependencies are
+        # DONE. It learns about finished tasks from the done / failed
+        # queues.
+        self._dag = _DAGScheduler(
+            release_cb=self._release_task,
+            fail_cb=self._fail_task)
+
+        for q, cb in [(self._done_queue, self._task_done),
+                      (self._failed_queue, self._task_failed)]:
+            watcher = threading.Thread(target=self._watch_finished_tasks, args=(q, cb))
+            watcher.daemon = True
+            watcher.start()
 
         self._bjw = None 
 
-        self._oftws = []
-        for x in range(0, constants.MAX_OUTPUT_TRANSFER_WORKERS):
-            oftw = _OutputTransferWorker(
-                wid=x+1,
+        # Shell for bulk operations on the remote working directory,
+        # opened on first use.
+        self._shell = None
+
+        # The scratch collector removes the working directories of
+        # finished tasks in the background.
+        if scratch_gc is not None:
+            self._scratch_gc = _ScratchCollector(
+                remote_workdir_url=remote_workdir_url,
+                mode=scratch_gc,
+                keep_failed=scratch_gc_keep_failed,
+                busy=self._staging_busy)
+            self._scratch_gc.start()
+        else:
+            self._scratch_gc = None
+
+        # The transfer workers are started on demand, either by autoscaling
+        # pools of worker processes or as one threaded transfer engine.
+        self._input_pool     = None
+        self._output_pool    = None
+        self._engine         = None
+        self._engine_started = False
+
+        if transfer_engine == constants.PROCESS_POOL:
+            self._input_pool = _TransferWorkerPool(
+                name="input transfer",
+                queue=self._ready_to_transfer_input_queue,
+                factory=self._create_input_transfer_worker,
+                min_workers=constants.MIN_INPUT_TRANSFER_WORKERS,
+                max_workers=constants.MAX_INPUT_TRANSFER_WORKERS)
+
+            self._output_pool = _TransferWorkerPool(
+                name="output transfer",
+                queue=self._ready_to_transfer_output_queue,
+                factory=self._create_output_transfer_worker,
+                min_workers=constants.MIN_OUTPUT_TRANSFER_WORKERS,
+                max_workers=constants.MAX_OUTPUT_TRANSFER_WORKERS)
+
+        elif transfer_engine == constants.THREAD_POOL:
+            self._engine = _TransferEngine(
+                resource_obj=self._resource_obj,
+                ready_to_transfer_input_q=self._ready_to_transfer_input_queue,
+                ready_to_exec_q=self._ready_to_execute_queue,
                 ready_to_transfer_output_q=self._ready_to_transfer_output_queue,
                 done_q=self._done_queue,
                 failed_q=self._failed_queue,
-            )
-            oftw.start()
-            self._oftws.append(oftw)
+                state_channel=self._state_channel,
+                input_cache_index=self._input_cache_index)
+
+        else:
+            raise Exception("Unknown transfer engine '%s'." % transfer_engine)
 
     # ------------------------------------------------------------------------
     #
@@ -145,52 +292,64 @@ class Resource(threading.Thread):
         """
         self._terminate_on_empty_queue = terminate_on_empty_queue
 
-        # Here we start the BigJob or SAGA-Pilot worker. 
-        from bigjobasync import USE_SAGA_PILOT
-        if USE_SAGA_PILOT is True:
+        # Here we start the BigJob, SAGA-Pilot or local worker.
+        backend = self._resource_obj['backend']
+        if backend == constants.SAGA_PILOT:
             logger.info("Using SAGA-Pilot for resource and task management.")
+            from bigjobasync.saga_pilot_worker import _SAGAPilotWorker as worker_class
 
-            from bigjobasync.saga_pilot_worker import _SAGAPilotWorker
-            self._bjw = _SAGAPilotWorker(
-                resource_obj=self._resource_obj,
-                ready_to_transfer_input_queue=self._ready_to_transfer_input_queue,
-                ready_to_exec_q=self._ready_to_execute_queue,
-                ready_to_transfer_output_q=self._ready_to_transfer_output_queue,
-                done_q=self._done_queue,
-                failed_q=self._failed_queue,
-            )
+        elif backend == constants.LOCALHOST:
+            logger.info("Using local subprocesses for task management.")
+            from bigjobasync.local_worker import _LocalWorker as worker_class
 
-        else: 
+        else:
             logger.info("Using BigJob for resource and task management.")
-
-            from bigjobasync.big_job_worker import _BigJobWorker
-            self._bjw = _BigJobWorker(
-                resource_obj=self._resource_obj,
-                ready_to_transfer_input_queue=self._ready_to_transfer_input_queue,
-                ready_to_exec_q=self._ready_to_execute_queue,
-                ready_to_transfer_output_q=self._ready_to_transfer_output_queue,
-                done_q=self._done_queue,
-                failed_q=self._failed_queue,
-            )
+            from bigjobasync.big_job_worker import _BigJobWorker as worker_class
+
+        self._bjw = worker_class(
+            resource_obj=self._resource_obj,
+            ready_to_transfer_input_queue=self._ready_to_transfer_input_queue,
+            ready_to_exec_q=self._ready_to_execute_queue,
+            ready_to_transfer_output_q=self._ready_to_transfer_output_queue,
+            done_q=self._done_queue,
+            failed_q=self._failed_queue,
+            state_channel=self._state_channel,
+        )
 
         self._bjw.start()
 
+        # Tasks reach the output stage from the pilot worker, which can't
+        # notify the pool, so its first workers must already be waiting.
+        if self._output_pool is not None:
+            self._output_pool.start_min_workers()
+
     # ------------------------------------------------------------------------
     #
     def stop(self):
         """Terminates the main thread loop in a coordinated fashion.
         """
-        self._bjw.stop()
+        if self._bjw is not None:
+            self._bjw.stop()
+        self._stop_transfer_workers()
+        self._close_shell()
+        if self._scratch_gc is not None:
+            self._scratch_gc.stop(flush=False)
 
     # ------------------------------------------------------------------------
     #
     def wait(self):
         """Waits for the resource to reach a terminal state.
         """
+        # wait until all tasks with dependencies have been released
+        self._dag.join()
+
         self._ready_to_transfer_input_queue.join()
         self._ready_to_execute_queue.join()
         self._ready_to_transfer_output_queue.join()
 
+        # wait until the final task states have reached the Task objects
+        self._state_dispatcher.join_tasks()
+
         if self._terminate_on_empty_queue is False:
             # wait until the BJ runs out of queue time
             self._bjw.join()
@@ -198,6 +357,13 @@ class Resource(threading.Thread):
             # terminate bigjob
             self._bjw.stop()
 
+        self._stop_transfer_workers()
+        self._close_shell()
+
+        # collect what's left
+        if self._scratch_gc is not None:
+            self._scratch_gc.stop(flush=True)
+
     # ------------------------------------------------------------------------
     #
     @property
@@ -210,13 +376,35 @@ class Resource(threading.Thread):
     #
     def schedule_tasks(self, tasks):
         """Schedules one or more tasks for execution.
+
+        Raises an exception if the tasks contain a dependency cycle or
+        depend on a task that hasn't been scheduled on this resource.
         """
         if not isinstance(tasks, list):
             tasks = [tasks] 
 
+        # Reject dependency cycles and dependencies on tasks that have
+        # never been scheduled before anything is registered.
+        self._dag.check(tasks)
+
+        shards = self._resource_obj['workdir_shards']
         for task in tasks:
             task._remote_workdir_url = self._resource_obj['remote_workdir_url']
-            self._ready_to_transfer_input_queue.put(task)
+            if shards is not None and task._workdir_created is False:
+                task._dir_name = "%s/%s" % (self._shard(task.uid, shards), task.dir_name)
+
+        if self._resource_obj['bulk_create_workdirs'] is True:
+            self._create_workdirs([t for t in tasks if t._workdir_created is False])
+
+        if self._scratch_gc is not None:
+            self._scratch_gc.add(tasks)
+
+        self._state_dispatcher.register(tasks)
+
+        # Tasks without unfinished dependencies go straight into the
+        # input transfer queue, the others are held back by the DAG
+        # scheduler until their dependencies are DONE.
+        self._dag.add(tasks)
 
     # ------------------------------------------------------------------------
     #
@@ -241,6 +429,171 @@ class Resource(threading.Thread):
 
         self._bjw.terminate()
 
+    # ------------------------------------------------------------------------
+    #
+    def _shard(self, uid, shards):
+        """Returns the name of the shard directory for a task uid.
+        """
+        shard = (zlib.crc32(str(uid)) & 0xffffffff) % shards
+        return "%0*d" % (len(str(shards - 1)), shard)
+
+    # ------------------------------------------------------------------------
+    #
+    def _create_workdirs(self, tasks):
+        """Creates the remote working directories of 'tasks' with as few
+        remote commands as possible. If that fails, the input transfer
+        workers create them one by one.
+        """
+        if len(tasks) == 0:
+            return
+
+        remote_workdir_url = self._resource_obj['remote_workdir_url']
+        workdir_path = saga.Url(remote_workdir_url).path.rstrip('/')
+        paths = [pipes.quote("%s/%s" % (workdir_path, task.dir_name)) for task in tasks]
+
+        try:
+            if self._shell is None or self._shell.broken:
+                self._shell = _RemoteShell(remote_workdir_url)
+            self._shell.run_args("mkdir -p", paths)
+        except Exception, ex:
+            logger.warning("Couldn't create task working directories in bulk: %s" % str(ex))
+            return
+
+        for task in tasks:
+            task._workdir_created = True
+        logger.info("Created %d task working directories in bulk" % len(tasks))
+
+    # ------------------------------------------------------------------------
+    #
+    def _staging_busy(self):
+        """Returns True if there are tasks waiting for file transfers.
+        """
+        return self._ready_to_transfer_input_queue.qsize() > 0 or \
+            self._ready_to_transfer_output_queue.qsize() > 0
+
+    # ------------------------------------------------------------------------
+    #
+    def _close_shell(self):
+        if self._shell is not None:
+            self._shell.close()
+            self._shell = None
+
+    # ------------------------------------------------------------------------
+    #
+    def _stop_transfer_workers(self):
+        """Sends a poison pill to every transfer worker and waits for them
+        to terminate. The pills go behind all queued tasks.
+        """
+        if self._engine is not None:
+            if self._engine_started is True:
+                self._ready_to_transfer_input_queue.put(None)
+                self._ready_to_transfer_output_queue.put(None)
+                self._engine.join(constants.TRANSFER_WORKER_TIMEOUT)
+                self._engine_started = False
+        else:
+            self._input_pool.stop()
+            self._output_pool.stop()
+
+    # ------------------------------------------------------------------------
+    #
+    def _create_input_transfer_worker(self, wid, progress):
+        return _InputTransferWorker(
+            wid=wid,
+            resource_obj=self._resource_obj,
+            ready_to_transfer_input_q=self._ready_to_transfer_input_queue,
+            ready_to_exec_q=self._ready_to_execute_queue,
+            done_q=self._done_queue,
+            failed_q=self._failed_queue,
+            state_channel=self._state_channel,
+            input_cache_index=self._input_cache_index,
+            progress=progress,
+        )
+
+    # ------------------------------------------------------------------------
+    #
+    def _create_output_transfer_worker(self, wid, progress):
+        return _OutputTransferWorker(
+            wid=wid,
+            resource_obj=self._resource_obj,
+            ready_to_transfer_output_q=self._ready_to_transfer_output_queue,
+            done_q=self._done_queue,
+            failed_q=self._failed_queue,
+            state_channel=self._state_channel,
+            progress=progress,
+        )
+
+    # ------------------------------------------------------------------------
+    #
+    def _watch_finished_tasks(self, queue, callback):
+        """Reports the uids of the tasks that arrive in the done or failed
+        queue to 'callback'. Runs in a separate thread.
+        """
+        while True:
+            task = queue.get()
+            callback(task.uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def _release_task(self, task):
+        """Puts a task into the input transfer queue. Only the task spec
+        travels to the workers, the Task object stays here.
+        """
+        self._ready_to_transfer_input_queue.put(_TaskSpec.from_task(task))
+
+        if self._engine is not None:
+            # called with the DAG scheduler's lock held, so this doesn't
+            # race with other releases
+            if self._engine_started is False:
+                self._engine.start()
+                self._engine_started = True
+        else:
+            self._input_pool.notify()
+
+    # ------------------------------------------------------------------------
+    #
+    def _task_state_changed(self, uid, state):
+        """Called by the state dispatcher for every task state record.
+        Wakes up the output pool when the pilot worker hands a task to
+        the output stage, so that it scales up right away. The record can
+        arrive shortly before the task is queued, in which case the pool
+        picks it up on its next check.
+        """
+        if self._output_pool is not None and \
+            state in [constants.WAITING_FOR_OUTPUT_TRANSFER, constants.FAILED]:
+            self._output_pool.notify()
+
+    # ------------------------------------------------------------------------
+    #
+    def _fail_task(self, task, error_msg):
+        """Fails a task that never got released into the input transfer
+        queue.
+        """
+        task._log.append(error_msg)
+        task._set_state(constants.FAILED)
+        if self._scratch_gc is not None:
+            self._scratch_gc.task_finished(task.uid, success=False)
+        self._state_dispatcher.task_finished(task.uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def _task_done(self, uid):
+        """Called when a task arrives in the done queue.
+        """
+        if self._scratch_gc is not None:
+            self._scratch_gc.task_finished(uid, success=True)
+        self._state_dispatcher.task_finished(uid)
+        self._dag.task_done(uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def _task_failed(self, uid):
+        """Called when a task arrives in the failed queue.
+        """
+        if self._scratch_gc is not None:
+            self._scratch_gc.task_finished(uid, success=False)
+        self._state_dispatcher.task_finished(uid)
+        self._dag.task_failed(uid)
+
     # ------------------------------------------------------------------------
     #
     def _set_state(self, new_state):
@@ -249,7 +602,7 @@ class Resource(threading.Thread):
             return
 
         old_state = self._resource_obj['state']
-        self._resource_obj['state'] = new_state
+        self._resource_obj['state']                = new_state
 
         for callback in self._resource_obj['callbacks']:
             callback(self, old_state, new_state)
@@ -8,10 +8,17 @@ __email__     = "ole.weidner@rutgers.edu"
 __copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
 __license__   = "MIT"
 
+import constants
+
 # ----------------------------------------------------------------------------
 # RESOURCE DICTIONARY
 
 RESOURCES = {
+    'LOCALHOST': {
+        'backend'       : constants.LOCALHOST, # runs tasks in local subprocesses
+        'shared_fs_url' : 'file://localhost/',
+    },
+
     'XSEDE.STAMPEDE': {
         'redis_host'      : 'gw68.quarry.iu.teragrid.org:6379',
         'redis_pwd'       : 'ILikeBigJob_wITH-REdIS',
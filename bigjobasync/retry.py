@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""Implements retries with exponential backoff for file transfers.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import time
+import saga
+import errno
+import socket
+import random
+import constants
+
+# saga-python exceptions that might go away by trying again (broken
+# connections, timeouts, ...)
+_TRANSIENT_SAGA_ERRORS = (
+    saga.exceptions.Timeout,
+    saga.exceptions.NoSuccess,
+    saga.exceptions.IncorrectState,
+)
+
+_TRANSIENT_ERRNOS = [errno.ETIMEDOUT, errno.ECONNRESET, errno.ECONNREFUSED,
+    errno.ECONNABORTED, errno.EPIPE, errno.EAGAIN, errno.EINTR, errno.ESTALE,
+    errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ENETDOWN]
+
+# errors of remote shell commands only come with their output
+_TRANSIENT_MESSAGES = ["Connection timed out", "Connection reset",
+    "Connection refused", "Broken pipe", "Resource temporarily unavailable",
+    "Stale file handle"]
+
+_PERMANENT_MESSAGES = ["No such file or directory", "Permission denied"]
+
+# ----------------------------------------------------------------------------
+#
+class _TransientError(Exception):
+    """Raised for failures that are worth retrying, e.g., a chunk that
+    couldn't be transferred.
+    """
+    pass
+
+# ----------------------------------------------------------------------------
+#
+def _is_transient(ex):
+    """Returns True if a transfer that failed with 'ex' might succeed if
+    it is tried again (broken connections, timeouts, ...). Everything
+    else, including programming errors, is permanent.
+    """
+    message = str(ex)
+    if any([m in message for m in _PERMANENT_MESSAGES]):
+        return False
+
+    if isinstance(ex, _TransientError) or isinstance(ex, _TRANSIENT_SAGA_ERRORS):
+        return True
+    if isinstance(ex, socket.error):
+        return True
+    if isinstance(ex, EnvironmentError) and ex.errno in _TRANSIENT_ERRNOS:
+        return True
+    return any([m in message for m in _TRANSIENT_MESSAGES])
+
+# ----------------------------------------------------------------------------
+#
+def _backoff(attempt):
+    """Returns the delay before retry number 'attempt' (1, 2, ...): it
+    doubles with every attempt, up to TRANSFER_RETRY_MAX_DELAY, and half of
+    it is random, so that workers that failed together don't retry
+    together.
+    """
+    delay = min(constants.TRANSFER_RETRY_MAX_DELAY,
+        constants.TRANSFER_RETRY_BACKOFF * 2 ** (attempt - 1))
+    return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+# ----------------------------------------------------------------------------
+#
+def _with_retries(func, log, what, attempts=None):
+    """Calls func(attempt) until it succeeds, at most 'attempts' (default:
+    TRANSFER_RETRIES) times. Errors that aren't transient are raised
+    right away. Failed attempts and delays are appended to 'log'.
+    """
+    if attempts is None:
+        attempts = constants.TRANSFER_RETRIES
+
+    attempt = 1
+    while True:
+        try:
+            result = func(attempt)
+        except Exception, ex:
+            if attempt >= attempts or not _is_transient(ex):
+                if attempt > 1:
+                    log.append("Giving up on %s after %d attempts" % (what, attempt))
+                raise
+            delay = _backoff(attempt)
+            log.append("Attempt %d/%d of %s failed: %s. Retrying in %.1fs" \
+                % (attempt, attempts, what, str(ex), delay))
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if attempt > 1:
+            log.append("%s succeeded after %d attempts" % (what[0].upper() + what[1:], attempt))
+        return result
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+
+"""Implements the background garbage collection of the remote working
+directories of finished tasks.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import time
+import saga
+import pipes
+import threading
+import constants
+
+from logger       import logger
+from remote_shell import _RemoteShell
+
+# ----------------------------------------------------------------------------
+#
+class _ScratchCollector(threading.Thread):
+    """Removes (DELETE) or archives and removes (ARCHIVE) the working
+    directories of finished tasks. Runs in the parent process and learns
+    about finished tasks from the Resource.
+
+    A directory is only collected once the task has been finished for
+    SCRATCH_GC_MIN_AGE seconds and all tasks that use its files as input
+    have finished, too. If 'keep_failed' is True, directories of failed
+    tasks are kept. At most SCRATCH_GC_BATCH_SIZE directories are collected
+    every SCRATCH_GC_INTERVAL seconds. While 'busy()' returns True (files
+    are being staged), collection is deferred for up to SCRATCH_GC_MAX_DEFER
+    seconds.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, remote_workdir_url, mode, keep_failed, busy):
+        """Creates a new collector. The thread has to be started.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        if mode not in [constants.DELETE, constants.ARCHIVE]:
+            raise Exception("Unknown scratch_gc mode '%s'." % mode)
+
+        self._url          = remote_workdir_url
+        self._workdir_path = saga.Url(remote_workdir_url).path.rstrip('/')
+        self._mode         = mode
+        self._keep_failed  = keep_failed
+        self._busy         = busy
+        self._shell        = None
+
+        self._lock     = threading.Lock()
+        self._wakeup   = threading.Event()
+        self._stopped  = False
+        self._flush    = False
+
+        self._dir_names = {}   # uid -> dir_name of scheduled tasks
+        self._needs     = {}   # uid -> uids of the tasks it uses as input
+        self._users     = {}   # uid -> uids of unfinished tasks using it
+        self._waiting   = {}   # uid -> finish time, waiting for its users
+        self._due       = []   # (finish time, dir_name)
+        self._busy_since = None
+
+    # ------------------------------------------------------------------------
+    #
+    def add(self, tasks):
+        """Registers scheduled tasks and the tasks they use as input.
+        """
+        from task import Task
+
+        with self._lock:
+            for task in tasks:
+                self._dir_names[task.uid] = task.dir_name
+                for directive in task.input:
+                    origin = directive.get('origin')
+                    if isinstance(origin, Task):
+                        self._needs.setdefault(task.uid, set()).add(origin.uid)
+                        self._users.setdefault(origin.uid, set()).add(task.uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def task_finished(self, uid, success):
+        """Called when a task is DONE or FAILED.
+        """
+        now = time.time()
+
+        with self._lock:
+            # the task doesn't need its input tasks any more
+            for origin_uid in self._needs.pop(uid, []):
+                users = self._users.get(origin_uid, set())
+                users.discard(uid)
+                if len(users) == 0:
+                    self._users.pop(origin_uid, None)
+                    if origin_uid in self._waiting:
+                        self._schedule(origin_uid, self._waiting.pop(origin_uid))
+
+            if success is False and self._keep_failed is True:
+                self._dir_names.pop(uid, None)
+            elif len(self._users.get(uid, [])) > 0:
+                self._waiting[uid] = now
+            else:
+                self._schedule(uid, now)
+
+    # ------------------------------------------------------------------------
+    #
+    def _schedule(self, uid, finished):
+        # Called with the lock held.
+        dir_name = self._dir_names.pop(uid, None)
+        if dir_name is not None:
+            self._due.append((finished, dir_name))
+
+    # ------------------------------------------------------------------------
+    #
+    def stop(self, flush=True):
+        """Stops the collector. If 'flush' is True, all directories that
+        can be collected are collected first, regardless of their age.
+        Directories of tasks that are still used by others are kept.
+        """
+        with self._lock:
+            self._stopped = True
+            self._flush   = flush
+        self._wakeup.set()
+        self.join()
+
+    # ------------------------------------------------------------------------
+    #
+    def run(self):
+        """DS
+        """
+        try:
+            while True:
+                self._wakeup.wait(constants.SCRATCH_GC_INTERVAL)
+                self._wakeup.clear()
+
+                with self._lock:
+                    stopped = self._stopped
+                    flush   = self._flush
+
+                if stopped is True:
+                    while flush is True and self._collect_batch(ignore_age=True) > 0:
+                        pass
+                    return
+
+                if self._defer() is False:
+                    self._collect_batch(ignore_age=False)
+        finally:
+            if self._shell is not None:
+                self._shell.close()
+
+    # ------------------------------------------------------------------------
+    #
+    def _defer(self):
+        """Returns True if collection should wait for staging to go idle.
+        """
+        try:
+            busy = self._busy()
+        except Exception:
+            busy = False
+
+        if busy is False:
+            self._busy_since = None
+            return False
+        if self._busy_since is None:
+            self._busy_since = time.time()
+        return time.time() - self._busy_since < constants.SCRATCH_GC_MAX_DEFER
+
+    # ------------------------------------------------------------------------
+    #
+    def _collect_batch(self, ignore_age):
+        """Collects up to SCRATCH_GC_BATCH_SIZE due directories. Returns
+        the number of directories it has tried to collect.
+        """
+        deadline = time.time() - constants.SCRATCH_GC_MIN_AGE
+
+        with self._lock:
+            batch = []
+            keep  = []
+            for finished, dir_name in self._due:
+                if len(batch) < constants.SCRATCH_GC_BATCH_SIZE and \
+                    (ignore_age is True or finished <= deadline):
+                    batch.append(dir_name)
+                else:
+                    keep.append((finished, dir_name))
+            self._due = keep
+
+        if len(batch) == 0:
+            return 0
+
+        paths = ["%s/%s" % (self._workdir_path, dir_name) for dir_name in batch]
+        try:
+            if self._shell is None or self._shell.broken:
+                self._shell = _RemoteShell(self._url)
+
+            if self._mode == constants.ARCHIVE:
+                self._archive(batch)
+            self._shell.run_args("rm -rf", [pipes.quote(path) for path in paths])
+            logger.info("Removed %d task working directories" % len(batch))
+
+        except Exception, ex:
+            # not retried: whatever is left stays on the scratch space
+            logger.warning("Couldn't remove task working directories: %s" % str(ex))
+
+        return len(batch)
+
+    # ------------------------------------------------------------------------
+    #
+    def _archive(self, batch):
+        """Packs each directory into its own archive in SCRATCH_GC_ARCHIVE_DIR
+        (relative to the remote working directory).
+        """
+        archive_dir = os.path.join(self._workdir_path, constants.SCRATCH_GC_ARCHIVE_DIR)
+        self._shell.run("mkdir -p %s" % pipes.quote(archive_dir))
+
+        for dir_name in batch:
+            # tasks that never got staged have no directory
+            archive = os.path.join(archive_dir, "%s.tar.gz" % os.path.basename(dir_name))
+            self._shell.run("test ! -d %s || tar czf %s -C %s %s" % (
+                pipes.quote(os.path.join(self._workdir_path, dir_name)), pipes.quote(archive),
+                pipes.quote(self._workdir_path), pipes.quote(dir_name)))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""Implements core-aware admission control for the pilot workers.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import time
+import constants
+
+# ----------------------------------------------------------------------------
+#
+class _SlotAccountant(object):
+    """Keeps track of the free cores of a pilot and decides which waiting
+    tasks can be admitted.
+
+    Higher priority tasks always go first. Among tasks of equal priority,
+    tasks are admitted in order (constants.FIRST_FIT) or the task that
+    leaves the fewest free cores is admitted next (constants.BEST_FIT).
+    Small tasks are backfilled around large tasks that don't fit yet.
+    Once a blocked task has waited longer than
+    constants.BACKFILL_RESERVATION_TIMEOUT, backfilling stops until the
+    blocked task fits, so that large tasks can't starve.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, cores, policy=constants.FIRST_FIT):
+        """Creates a new accountant for a pilot with 'cores' cores.
+        """
+        if policy not in [constants.FIRST_FIT, constants.BEST_FIT]:
+            raise Exception("Unsupported admission policy '%s'" % policy)
+
+        self._total  = int(cores)
+        self._free   = int(cores)
+        self._policy = policy
+        self._allocations = {}
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def total(self):
+        """Returns the total number of cores.
+        """
+        return self._total
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def free(self):
+        """Returns the number of free cores.
+        """
+        return self._free
+
+    # ------------------------------------------------------------------------
+    #
+    def admit(self, entries):
+        """Selects the entries (task table entries) that can be admitted
+        and allocates their cores. Returns a tuple (admitted, rejected),
+        where 'rejected' contains the tasks that will never fit.
+
+        'entries' need to be ordered by priority. The policy only decides
+        between tasks of equal priority.
+        """
+        admitted = []
+        rejected = []
+        now = time.time()
+
+        for level in self._priority_levels(entries):
+            if self._free == 0:
+                # nothing else fits. No need to look at the remaining
+                # (possibly many) tasks.
+                break
+
+            candidates = []
+            for pt in level:
+                if self._cores(pt) > self._total:
+                    rejected.append(pt)
+                else:
+                    candidates.append(pt)
+
+            if self._policy == constants.BEST_FIT:
+                reserved = self._admit_best_fit(candidates, admitted, now)
+            else:
+                reserved = self._admit_first_fit(candidates, admitted, now)
+
+            if reserved is True:
+                # A task has waited long enough. Reserve the cores that
+                # become free for it, i.e., stop backfilling.
+                break
+
+        return admitted, rejected
+
+    # ------------------------------------------------------------------------
+    #
+    def _admit_first_fit(self, candidates, admitted, now):
+        """Admits the tasks that fit, in order. Returns True if a blocked
+        task has waited longer than BACKFILL_RESERVATION_TIMEOUT.
+        """
+        for pt in candidates:
+            if self._cores(pt) <= self._free:
+                self._allocate(pt['task'].uid, self._cores(pt))
+                admitted.append(pt)
+            elif self._starving(pt, now):
+                return True
+
+            if self._free == 0:
+                break
+        return False
+
+    # ------------------------------------------------------------------------
+    #
+    def _admit_best_fit(self, candidates, admitted, now):
+        """Repeatedly admits the task that leaves the fewest free cores.
+        Tasks that have waited longer than BACKFILL_RESERVATION_TIMEOUT go
+        first. Returns True if one of them doesn't fit.
+        """
+        for pt in [c for c in candidates if self._starving(c, now)]:
+            if self._cores(pt) > self._free:
+                return True
+            self._allocate(pt['task'].uid, self._cores(pt))
+            admitted.append(pt)
+            candidates.remove(pt)
+
+        while self._free > 0:
+            best = None
+            for pt in candidates:
+                cores = self._cores(pt)
+                # strictly larger, so that equally sized tasks keep their
+                # order
+                if cores <= self._free and (best is None or cores > self._cores(best)):
+                    best = pt
+            if best is None:
+                break
+            self._allocate(best['task'].uid, self._cores(best))
+            admitted.append(best)
+            candidates.remove(best)
+
+        return False
+
+    # ------------------------------------------------------------------------
+    #
+    def _priority_levels(self, entries):
+        """Splits 'entries' into lists of consecutive entries with the same
+        priority.
+        """
+        levels = []
+        for pt in entries:
+            priority = pt['task'].priority
+            if len(levels) == 0 or levels[-1][0] != priority:
+                levels.append((priority, []))
+            levels[-1][1].append(pt)
+        return [level for _, level in levels]
+
+    # ------------------------------------------------------------------------
+    #
+    def _starving(self, pt, now):
+        return now - pt.get('state_since', now) >= \
+            constants.BACKFILL_RESERVATION_TIMEOUT
+
+    # ------------------------------------------------------------------------
+    #
+    def release(self, uid):
+        """Releases the cores allocated to a task. Does nothing if the
+        task doesn't hold an allocation.
+        """
+        cores = self._allocations.pop(uid, 0)
+        self._free += cores
+
+    # ------------------------------------------------------------------------
+    #
+    def _allocate(self, uid, cores):
+        self._allocations[uid] = cores
+        self._free -= cores
+
+    # ------------------------------------------------------------------------
+    #
+    def _cores(self, pt):
+        cores = pt['task'].cores
+        if cores is None:
+            return 1
+        return int(cores)
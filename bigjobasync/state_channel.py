@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+"""Implements the channel that propagates task state changes from the
+worker processes back to the Task objects in the parent process.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import time
+import threading
+import constants
+import multiprocessing
+
+from logger import logger
+
+# ----------------------------------------------------------------------------
+#
+class _StateChannel(object):
+    """Carries (uid, state, timestamp, log delta) records from the worker
+    processes to the parent process.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self):
+        """Creates a new state channel. Needs to be created before the
+        worker processes are started.
+        """
+        self._q = multiprocessing.Queue()
+
+    # ------------------------------------------------------------------------
+    #
+    def publish(self, uid, state, log_delta=[]):
+        """Publishes a state change and the log entries that were added
+        since the last record.
+        """
+        self._q.put((uid, state, time.time(), list(log_delta)))
+
+    # ------------------------------------------------------------------------
+    #
+    def get(self, timeout=None):
+        """Returns the next record. Raises Queue.Empty after 'timeout'.
+        """
+        return self._q.get(True, timeout)
+
+
+# ----------------------------------------------------------------------------
+#
+class _StateDispatcher(threading.Thread):
+    """Applies the records of a state channel to the registered Task
+    objects, which fires their callbacks in the parent process.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, channel, state_cb=None):
+        """Creates a new dispatcher for 'channel'. 'state_cb(uid, state)'
+        is called for every record after it has been applied.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        self._channel  = channel
+        self._state_cb = state_cb
+        self._cond     = threading.Condition()
+        self._tasks    = {}   # uid -> task
+        self._last_ts  = {}   # uid -> timestamp of the last applied state
+        self._finished = set()
+        self._open     = set()   # uids of tasks that have not finished
+
+    # ------------------------------------------------------------------------
+    #
+    def register(self, tasks):
+        """Registers the Task objects that records get applied to.
+        """
+        with self._cond:
+            for task in tasks:
+                self._tasks[task.uid] = task
+                self._open.add(task.uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def task_finished(self, uid):
+        """Marks a task as finished, i.e., it has left the last stage.
+        """
+        with self._cond:
+            self._finished.add(uid)
+            self._update_open(uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def join_tasks(self):
+        """Blocks until all registered tasks have finished and their final
+        state has been applied.
+        """
+        with self._cond:
+            while len(self._open) > 0:
+                # wait with a timeout so that the main thread stays
+                # responsive to KeyboardInterrupt
+                self._cond.wait(1)
+
+    # ------------------------------------------------------------------------
+    #
+    def run(self):
+        """Dispatches records until the process ends.
+        """
+        while True:
+            # errors must not end the thread while tasks are open:
+            # join_tasks() would wait for them forever
+            try:
+                record = self._channel.get()
+            except Exception, ex:
+                with self._cond:
+                    if len(self._open) == 0:
+                        return
+                logger.error("Couldn't read from the task state channel: %s" % str(ex))
+                time.sleep(constants.UPDATE_INTERVAL)
+                continue
+
+            try:
+                self._dispatch(record)
+            except Exception, ex:
+                logger.error("Couldn't dispatch task state record: %s" % str(ex))
+
+    # ------------------------------------------------------------------------
+    #
+    def _dispatch(self, record):
+        """Applies one record to its Task object.
+        """
+        uid, state, timestamp, log_delta = record
+
+        with self._cond:
+            task = self._tasks.get(uid)
+            if task is None:
+                logger.warning("Received state '%s' for unknown task %s." % (state, uid))
+                return
+
+            task._log.extend(log_delta)
+
+            # Records from different processes can overtake each
+            # other. Never go back to an older state.
+            if timestamp < self._last_ts.get(uid, 0):
+                return
+            self._last_ts[uid] = timestamp
+
+        # fire the callbacks outside of the lock. A failing callback
+        # doesn't stop the dispatcher.
+        try:
+            task._set_state(state)
+        except Exception, ex:
+            logger.error("Callback of task %s failed in state '%s': %s" % (task.name, state, str(ex)))
+
+        with self._cond:
+            self._update_open(uid)
+
+        if self._state_cb is not None:
+            self._state_cb(uid, state)
+
+    # ------------------------------------------------------------------------
+    #
+    def _update_open(self, uid):
+        """Called with the lock held.
+        """
+        task = self._tasks.get(uid)
+        if task is None or uid not in self._finished:
+            return
+        if task.state in [constants.DONE, constants.FAILED]:
+            self._open.discard(uid)
+            self._cond.notify_all()
@@ -19,8 +19,17 @@ class Task(Traceable):
     # ------------------------------------------------------------------------
     #
     def __init__(self, name, executable, arguments=[], environment={}, 
-                 input=[], output=[], cores=1):
+                 input=[], output=[], cores=1, priority=0, group=None,
+                 depends_on=[]):
         """Constructs a new Task object.
+
+        Tasks with a higher 'priority' are processed first at every
+        stage. 'group' identifies the task group for fair-share
+        scheduling (see Resource 'fair_share').
+
+        'depends_on' is a list of Tasks that need to be DONE before this
+        task starts its input transfer. Tasks that are used as 'origin'
+        of an input directive are added to it automatically.
         """
         self._uid = uuid.uuid4()
 
@@ -35,9 +44,18 @@ class Task(Traceable):
         self._cores       = cores
         self._input       = input
         self._output      = output
+        self._priority    = priority
+        self._group       = group
+
+        self._depends_on  = list(depends_on)
+        for directive in input:
+            origin = directive.get('origin')
+            if isinstance(origin, Task) and origin not in self._depends_on:
+                self._depends_on.append(origin)
 
         self._dir_name = "%s__%s" % (self.name, self.uid)
         self._remote_workdir_url = None
+        self._workdir_created    = False
 
         # Traceable interface
         Traceable.__init__(self)
@@ -113,6 +131,30 @@ class Task(Traceable):
         """
         return self._cores
 
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def priority(self):
+        """Returns the priority of the Task.
+        """
+        return self._priority
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def group(self):
+        """Returns the group the Task belongs to.
+        """
+        return self._group
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def depends_on(self):
+        """Returns the list of Tasks this Task depends on.
+        """
+        return self._depends_on
+
     # ------------------------------------------------------------------------
     #
     @property
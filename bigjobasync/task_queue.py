@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""Implements the priority / fair-share task queues that connect the
+different stages (input transfer, execution, output transfer).
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import heapq
+import Queue
+import itertools
+
+from multiprocessing.managers import BaseManager
+
+# ----------------------------------------------------------------------------
+#
+class _TaskQueue(Queue.Queue):
+    """A joinable queue that returns tasks with a higher 'priority' first.
+
+    If 'fair_share' is True, tasks of equal priority are interleaved
+    between task groups (Task.group) using start-time fair queueing:
+    every group advances its own virtual clock by one per task, so a
+    large group can't starve a small one. Without fair-share, tasks of
+    equal priority are returned in FIFO order.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, fair_share=False):
+        """Creates a new, empty task queue.
+        """
+        self._fair_share = fair_share
+        Queue.Queue.__init__(self)
+
+    # ------------------------------------------------------------------------
+    #
+    def _init(self, maxsize):
+        self.queue    = []
+        self._counter = itertools.count()
+        self._vtime   = 0
+        self._group_vtime = {}
+
+    # ------------------------------------------------------------------------
+    #
+    def _qsize(self, len=len):
+        return len(self.queue)
+
+    # ------------------------------------------------------------------------
+    #
+    def _put(self, item):
+        if item is None:
+            # poison pill: goes behind everything else
+            priority = float('-inf')
+        else:
+            priority = getattr(item, 'priority', 0)
+
+        if self._fair_share is True:
+            group = getattr(item, 'group', None)
+            vtime = max(self._vtime, self._group_vtime.get(group, 0)) + 1
+            self._group_vtime[group] = vtime
+        else:
+            vtime = 0
+
+        heapq.heappush(self.queue, (-priority, vtime, next(self._counter), item))
+
+    # ------------------------------------------------------------------------
+    #
+    def _get(self):
+        _, vtime, _, item = heapq.heappop(self.queue)
+        self._vtime = max(self._vtime, vtime)
+        return item
+
+
+# ----------------------------------------------------------------------------
+#
+class _TaskQueueManager(BaseManager):
+    """Hosts the task queues in a separate process so that they can be
+    shared by the worker processes.
+    """
+    pass
+
+_TaskQueueManager.register('TaskQueue', _TaskQueue,
+    exposed=['put', 'put_nowait', 'get', 'get_nowait', 'task_done', 'join',
+             'qsize', 'empty'])
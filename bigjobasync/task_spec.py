@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""Implements the compact wire format in which tasks travel between the
+different stages (input transfer, execution, output transfer).
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+from collections import namedtuple
+
+# ----------------------------------------------------------------------------
+#
+class _TaskRef(namedtuple('_TaskRef', ['uid', 'remote_workdir_url', 'dir_name'])):
+    """Replaces a Task that is used as 'origin' of an input directive.
+    """
+    __slots__ = ()
+
+
+# ----------------------------------------------------------------------------
+#
+class _TaskSpec(namedtuple('_TaskSpec', ['uid', 'name', 'dir_name',
+    'remote_workdir_url', 'executable', 'arguments', 'environment', 'cores',
+    'input', 'output', 'priority', 'group', 'workdir_created', 'state'])):
+    """Immutable description of a task that contains only what the stages
+    need. The Task objects themselves (with callbacks, log and trace) stay
+    in the parent process.
+    """
+    __slots__ = ()
+
+    # ------------------------------------------------------------------------
+    #
+    @classmethod
+    def from_task(cls, task):
+        """Creates the spec for a Task object.
+        """
+        from task import Task
+
+        input = []
+        for directive in task.input:
+            origin = directive.get('origin')
+            if isinstance(origin, Task):
+                directive = dict(directive)
+                directive['origin'] = _TaskRef(
+                    uid=origin.uid,
+                    remote_workdir_url=(origin._remote_workdir_url or task._remote_workdir_url),
+                    dir_name=origin.dir_name)
+            input.append(directive)
+
+        return cls(
+            uid=task.uid,
+            name=task.name,
+            dir_name=task.dir_name,
+            remote_workdir_url=task._remote_workdir_url,
+            executable=task.executable,
+            arguments=task.arguments,
+            environment=task.environment,
+            cores=task.cores,
+            input=tuple(input),
+            output=tuple(task.output),
+            priority=task.priority,
+            group=task.group,
+            workdir_created=task._workdir_created,
+            state=task.state)
+
+    # ------------------------------------------------------------------------
+    #
+    def __str__(self):
+        return self.name
+
+
+# ----------------------------------------------------------------------------
+#
+class _ActiveTask(object):
+    """Worker-side view of a _TaskSpec. Provides the attributes of the spec
+    plus a mutable state and log. State changes and new log entries are
+    published through the state channel, the latter also when the task is
+    handed off. 'spec' returns the spec with the
+    current state, to be passed on to the next stage.
+    """
+    __slots__ = ('_spec', '_state', '_log', '_log_published', '_channel')
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, spec, channel):
+        self._spec  = spec
+        self._state = spec.state
+        self._log   = []
+        self._log_published = 0
+        self._channel = channel
+
+    # ------------------------------------------------------------------------
+    #
+    def __getattr__(self, name):
+        return getattr(self._spec, name)
+
+    # ------------------------------------------------------------------------
+    #
+    def __str__(self):
+        return self._spec.name
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def state(self):
+        return self._state
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def spec(self):
+        """Returns the spec with the current state. Used to hand the task
+        to the next stage, so log entries that haven't been published
+        yet (because there was no state change after them) are published
+        first.
+        """
+        self._set_state(self._state)
+
+        if self._spec.state != self._state:
+            self._spec = self._spec._replace(state=self._state)
+        return self._spec
+
+    # ------------------------------------------------------------------------
+    #
+    def _set_state(self, new_state):
+        """Publishes a state change and the new log entries.
+        """
+        log_delta = self._log[self._log_published:]
+        if self._state == new_state and len(log_delta) == 0:
+            return
+
+        self._state = new_state
+        self._log_published = len(self._log)
+        self._channel.publish(self._spec.uid, new_state, log_delta)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""Implements the physical task table used by the pilot workers.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import constants
+
+from collections import OrderedDict
+
+# ----------------------------------------------------------------------------
+# BUCKETS
+WAITING  = 'waiting'
+PENDING  = 'pending'
+RUNNING  = 'running'
+FINISHED = 'finished'
+
+_BUCKET_FOR_STATE = {
+    constants.WAITING_FOR_EXECUTION       : WAITING,
+    constants.PENDING                     : PENDING,
+    constants.RUNNING                     : RUNNING,
+    constants.WAITING_FOR_OUTPUT_TRANSFER : FINISHED,
+    constants.DONE                        : FINISHED,
+    constants.FAILED                      : FINISHED,
+}
+
+# ----------------------------------------------------------------------------
+#
+class _TaskTable(object):
+    """Physical tasks keyed by task uid, with one bucket per scheduling
+    state. Entries are dicts with (at least) a 'task' and a 'cu' key.
+
+    Buckets keep their insertion order, so tasks are scheduled in the
+    order in which they arrived.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self):
+        """Creates a new, empty task table.
+        """
+        self._entries = {}
+        self._buckets = {
+            WAITING  : OrderedDict(),
+            PENDING  : OrderedDict(),
+            RUNNING  : OrderedDict(),
+            FINISHED : OrderedDict(),
+        }
+
+    # ------------------------------------------------------------------------
+    #
+    def __len__(self):
+        return len(self._entries)
+
+    # ------------------------------------------------------------------------
+    #
+    def __contains__(self, uid):
+        return uid in self._entries
+
+    # ------------------------------------------------------------------------
+    #
+    def add(self, task):
+        """Adds a task to the table and returns its entry.
+        """
+        entry = {'task': task, 'cu': None, 'bucket': None}
+        self._entries[task.uid] = entry
+        self.update(entry)
+        return entry
+
+    # ------------------------------------------------------------------------
+    #
+    def update(self, entry):
+        """Moves an entry into the bucket that corresponds to the current
+        state of its task. Tasks in states that are not handled by the
+        pilot workers end up in the 'finished' bucket.
+        """
+        bucket = _BUCKET_FOR_STATE.get(entry['task'].state, FINISHED)
+        if bucket == entry['bucket']:
+            return
+
+        uid = entry['task'].uid
+        if entry['bucket'] is not None:
+            del self._buckets[entry['bucket']][uid]
+        self._buckets[bucket][uid] = entry
+        entry['bucket'] = bucket
+
+    # ------------------------------------------------------------------------
+    #
+    def remove(self, entry):
+        """Removes an entry from the table.
+        """
+        uid = entry['task'].uid
+        del self._buckets[entry['bucket']][uid]
+        del self._entries[uid]
+
+    # ------------------------------------------------------------------------
+    #
+    def get(self, uid):
+        """Returns the entry for a task uid or None.
+        """
+        return self._entries.get(uid)
+
+    # ------------------------------------------------------------------------
+    #
+    def bucket(self, *buckets):
+        """Returns a snapshot (list) of the entries in one or more buckets.
+        The table can be modified while iterating over the snapshot.
+        """
+        entries = []
+        for bucket in buckets:
+            entries.extend(self._buckets[bucket].values())
+        return entries
+
+    # ------------------------------------------------------------------------
+    #
+    def count(self, bucket):
+        """Returns the number of entries in a bucket.
+        """
+        return len(self._buckets[bucket])
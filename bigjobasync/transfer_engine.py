@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""Implements the threaded transfer engine, a single multiprocessing.Process
+that processes many input and output transfers concurrently.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import Queue
+import threading
+import constants
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+from logger                 import logger
+from remote_shell           import _RemoteShellCache
+from directory_pool         import _DirectoryPool
+from input_transfer_worker  import _InputTransferWorker
+from output_transfer_worker import _OutputTransferWorker
+
+# ----------------------------------------------------------------------------
+#
+class _TransferEngine(multiprocessing.Process):
+    """Alternative to the input / output transfer worker processes. One
+    dispatcher thread per queue hands tasks to a pool of
+    TRANSFER_ENGINE_THREADS threads, so that many (I/O bound) transfers run
+    at the same time. All threads share one directory handle pool that
+    allows at most TRANSFER_ENGINE_HOST_LIMIT concurrent operations per
+    host.
+
+    The transfers themselves are done by the same code as in the worker
+    processes, so tasks go through the same state transitions.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, resource_obj, ready_to_transfer_input_q, ready_to_exec_q,
+                 ready_to_transfer_output_q, done_q, failed_q, state_channel,
+                 input_cache_index=None):
+        """DS
+        """
+        multiprocessing.Process.__init__(self)
+        self.daemon = True
+        self._stop  = multiprocessing.Event()
+
+        self._input_q  = ready_to_transfer_input_q
+        self._output_q = ready_to_transfer_output_q
+
+        # The workers are never started. They are only used for the
+        # transfer code.
+        self._input_worker = _InputTransferWorker(
+            wid=0,
+            resource_obj=resource_obj,
+            ready_to_transfer_input_q=ready_to_transfer_input_q,
+            ready_to_exec_q=ready_to_exec_q,
+            done_q=done_q,
+            failed_q=failed_q,
+            state_channel=state_channel,
+            input_cache_index=input_cache_index)
+
+        self._output_worker = _OutputTransferWorker(
+            wid=0,
+            resource_obj=resource_obj,
+            ready_to_transfer_output_q=ready_to_transfer_output_q,
+            done_q=done_q,
+            failed_q=failed_q,
+            state_channel=state_channel)
+
+        logger.info("Starting TransferEngine with %d threads" % constants.TRANSFER_ENGINE_THREADS)
+
+    # ------------------------------------------------------------------------
+    #
+    def stop(self):
+        """Signals the engine to terminate. Can be called from the parent
+        process. Putting None (poison pill) into both queues has the same
+        effect, but only after all tasks before it have been processed.
+        """
+        self._stop.set()
+
+    # ------------------------------------------------------------------------
+    #
+    def run(self):
+        """DS
+        """
+        fs_pool = _DirectoryPool(max_per_host=constants.TRANSFER_ENGINE_HOST_LIMIT)
+        shells  = _RemoteShellCache()
+        self._input_worker._open_session(fs_pool, shells)
+        self._output_worker._open_session(fs_pool, shells)
+
+        # The dispatchers don't take more tasks than there are free threads,
+        # so that the priority order of the queues is preserved.
+        self._threads = ThreadPool(constants.TRANSFER_ENGINE_THREADS)
+        self._free    = threading.Semaphore(constants.TRANSFER_ENGINE_THREADS)
+
+        dispatchers = [
+            threading.Thread(target=self._dispatch_input),
+            threading.Thread(target=self._dispatch_output)]
+        try:
+            for dispatcher in dispatchers:
+                dispatcher.start()
+            for dispatcher in dispatchers:
+                dispatcher.join()
+
+            # let the running transfers finish
+            self._threads.close()
+            self._threads.join()
+        finally:
+            shells.close()
+            fs_pool.close()
+
+    # ------------------------------------------------------------------------
+    #
+    def _dispatch_input(self):
+        while True:
+            spec = self._next(self._input_q)
+            if spec is None:
+                return
+
+            specs, got_pill = self._input_worker._get_batch([spec])
+            self._submit(self._input_worker._process_batch, specs)
+
+            if got_pill is True:
+                self._input_q.task_done()
+                return
+
+    # ------------------------------------------------------------------------
+    #
+    def _dispatch_output(self):
+        while True:
+            spec = self._next(self._output_q)
+            if spec is None:
+                return
+            self._submit(self._output_worker._process_task, spec)
+
+    # ------------------------------------------------------------------------
+    #
+    def _next(self, queue):
+        """Waits for a free thread and the next task in 'queue'. Returns
+        None if the engine should terminate.
+        """
+        self._free.acquire()
+        while not self._stop.is_set():
+            try:
+                spec = queue.get(True, constants.TRANSFER_WORKER_TIMEOUT)
+            except Queue.Empty:
+                continue
+
+            if spec is None:
+                # poison pill: we are done.
+                queue.task_done()
+                break
+            return spec
+
+        self._free.release()
+        return None
+
+    # ------------------------------------------------------------------------
+    #
+    def _submit(self, func, arg):
+        def run():
+            try:
+                func(arg)
+            except Exception, ex:
+                # _process_* handle task errors themselves
+                logger.error("Unexpected error in transfer engine: %s" % str(ex))
+            finally:
+                self._free.release()
+
+        self._threads.apply_async(run)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""Implements the local transfer manifest, which remembers which local
+input files have been uploaded where, so that unchanged files don't need
+to be uploaded again.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import os
+import json
+import fcntl
+import hashlib
+import tempfile
+import threading
+
+from contextlib import contextmanager
+
+# ----------------------------------------------------------------------------
+#
+def _file_sha1(path):
+    """Returns the SHA-1 (hex) of the content of a local file.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+# ----------------------------------------------------------------------------
+#
+class _TransferManifest(object):
+    """A JSON file that maps (local file, remote host) to the size, mtime
+    and SHA-1 of the file at the time of the last upload and the URL it
+    was uploaded to. The file can be shared by several processes (and
+    runs); updates are serialized with an fcntl lock. Within a process,
+    the manifest can be shared by several threads.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, path):
+        """Opens the manifest at 'path'. The file is created with the
+        first record().
+        """
+        self._path      = os.path.abspath(os.path.expanduser(path))
+        self._lock_path = "%s.lock" % self._path
+        self._entries   = {}
+        self._loaded    = None   # (mtime, size) of the file we have read
+
+        # guards _entries and _loaded. Always taken before the fcntl lock.
+        self._lock      = threading.Lock()
+
+    # ------------------------------------------------------------------------
+    #
+    def lookup(self, local_path, host_url):
+        """Returns the entry of 'local_path' for the host 'host_url' if the
+        local file hasn't changed since it was recorded, otherwise None.
+        The file is only hashed if its mtime has changed.
+        """
+        with self._lock:
+            self._reload()
+            entry = self._entries.get(self._key(local_path, host_url))
+        if entry is None:
+            return None
+
+        stat = os.stat(local_path)
+        if stat.st_size != entry['size']:
+            return None
+        if stat.st_mtime != entry['mtime'] and _file_sha1(local_path) != entry['sha1']:
+            return None
+
+        return entry
+
+    # ------------------------------------------------------------------------
+    #
+    def record(self, local_path, host_url, remote_path):
+        """Records that 'local_path' has been uploaded to 'remote_path' on
+        the host 'host_url'.
+        """
+        stat  = os.stat(local_path)
+        entry = {
+            'size'        : stat.st_size,
+            'mtime'       : stat.st_mtime,
+            'sha1'        : _file_sha1(local_path),
+            'remote_path' : remote_path
+        }
+
+        with self._lock, self._locked(fcntl.LOCK_EX):
+            self._read()
+            self._entries[self._key(local_path, host_url)] = entry
+
+            manifest_dir = os.path.dirname(self._path)
+            fd, tmp_path = tempfile.mkstemp(dir=manifest_dir, prefix=".manifest-")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self._entries, f)
+            os.rename(tmp_path, self._path)
+            self._loaded = self._file_version()
+
+    # ------------------------------------------------------------------------
+    #
+    def _key(self, local_path, host_url):
+        return "%s %s" % (host_url, os.path.abspath(local_path))
+
+    # ------------------------------------------------------------------------
+    #
+    def _reload(self):
+        """Re-reads the manifest if another process has changed it.
+        Called with the thread lock held.
+        """
+        if self._file_version() != self._loaded:
+            with self._locked(fcntl.LOCK_SH):
+                self._read()
+
+    # ------------------------------------------------------------------------
+    #
+    def _read(self):
+        # Called with both locks held.
+        self._loaded = self._file_version()
+        if self._loaded is None:
+            self._entries = {}
+            return
+        with open(self._path, 'r') as f:
+            self._entries = json.load(f)
+
+    # ------------------------------------------------------------------------
+    #
+    def _file_version(self):
+        try:
+            stat = os.stat(self._path)
+            return (stat.st_mtime, stat.st_size, stat.st_ino)
+        except OSError:
+            return None
+
+    # ------------------------------------------------------------------------
+    #
+    @contextmanager
+    def _locked(self, mode):
+        manifest_dir = os.path.dirname(self._path)
+        if not os.path.isdir(manifest_dir):
+            os.makedirs(manifest_dir)
+
+        with open(self._lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
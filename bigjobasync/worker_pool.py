@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""Implements the autoscaling pools of transfer worker processes.
+"""
+
+__author__    = "Ole Weidner"
+__email__     = "ole.weidner@rutgers.edu"
+__copyright__ = "Copyright 2013-2014, The RADICAL Project at Rutgers"
+__license__   = "MIT"
+
+import math
+import time
+import threading
+import constants
+import multiprocessing
+
+from logger import logger
+
+# ----------------------------------------------------------------------------
+#
+class _TransferWorkerPool(object):
+    """Starts and retires transfer workers that consume 'queue'.
+
+    No worker is started before the first task arrives (or before
+    start_min_workers() is called). From then on, the pool keeps between 'min_workers' and 'max_workers' workers. The number
+    of workers follows the queue depth and the measured throughput per
+    worker: the pool aims at draining the queue within AUTOSCALE_TARGET_
+    LATENCY seconds. Workers that are not needed for AUTOSCALE_IDLE_TIMEOUT
+    seconds are retired (one at a time) with a poison pill, which a worker
+    only gets once the queue is empty.
+
+    'factory(wid, progress)' creates (but doesn't start) a worker. Workers
+    increment the shared counter 'progress' for every processed task.
+    """
+
+    # ------------------------------------------------------------------------
+    #
+    def __init__(self, name, queue, factory, min_workers, max_workers):
+        """Creates a new pool. Starts the scaling thread, but no workers.
+        """
+        self._name        = name
+        self._queue       = queue
+        self._factory     = factory
+        self._min_workers = max(0, min(min_workers, max_workers))
+        self._max_workers = max(1, max_workers)
+
+        self._lock        = threading.Lock()
+        self._wakeup      = threading.Event()
+        self._stopped     = False
+        self._workers     = []
+        self._pills       = 0      # pills that no worker has taken yet
+        self._next_wid    = 1
+        self._demand_seen = False
+        self._idle_since  = None
+        self._progress    = multiprocessing.Value('i', 0)
+
+        self._last_check    = time.time()
+        self._last_progress = 0
+        self._rate          = None   # tasks / second / worker
+
+        self._thread = threading.Thread(target=self._scale_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    # ------------------------------------------------------------------------
+    #
+    def notify(self):
+        """Tells the pool that new tasks have been queued, so that it can
+        scale up right away.
+        """
+        self._wakeup.set()
+
+    # ------------------------------------------------------------------------
+    #
+    def start_min_workers(self):
+        """Starts 'min_workers' workers right away instead of waiting for
+        the first task, so that the first task doesn't wait for the
+        scaling thread.
+        """
+        with self._lock:
+            if self._stopped is True:
+                return
+            self._demand_seen = True
+            self._scale()
+
+    # ------------------------------------------------------------------------
+    #
+    @property
+    def size(self):
+        """The number of active workers (not counting retiring ones).
+        """
+        with self._lock:
+            self._reap()
+            return len(self._workers) - self._pills
+
+    # ------------------------------------------------------------------------
+    #
+    def stop(self):
+        """Sends a poison pill to every worker and waits for them to
+        terminate. The pills go behind all queued tasks.
+        """
+        with self._lock:
+            self._stopped = True
+            self._reap()
+            workers = list(self._workers)
+            for i in range(len(workers) - self._pills):
+                self._queue.put(None)
+            self._workers = []
+            self._pills   = 0
+
+        self._wakeup.set()
+
+        for worker in workers:
+            worker.join(constants.TRANSFER_WORKER_TIMEOUT)
+
+    # ------------------------------------------------------------------------
+    #
+    def _scale_loop(self):
+        while True:
+            self._wakeup.wait(constants.AUTOSCALE_INTERVAL)
+            self._wakeup.clear()
+
+            with self._lock:
+                if self._stopped is True:
+                    return
+                try:
+                    self._scale()
+                except Exception, ex:
+                    logger.error("Couldn't scale %s worker pool: %s" % (self._name, str(ex)))
+
+    # ------------------------------------------------------------------------
+    #
+    def _scale(self):
+        # Called with the lock held.
+        self._reap()
+
+        now    = time.time()
+        depth  = self._queue.qsize()
+        active = len(self._workers) - self._pills
+
+        # measure the throughput per worker
+        progress = self._progress.value
+        if active > 0 and now > self._last_check and progress > self._last_progress:
+            rate = float(progress - self._last_progress) / (now - self._last_check) / active
+            if self._rate is None:
+                self._rate = rate
+            else:
+                # smooth out short-term fluctuations
+                self._rate = 0.5 * self._rate + 0.5 * rate
+        self._last_check    = now
+        self._last_progress = progress
+
+        if depth > 0:
+            self._demand_seen = True
+        if self._demand_seen is False:
+            # start lazily
+            return
+
+        if self._rate is None:
+            # no measurements yet: one worker per queued task
+            wanted = depth
+        else:
+            per_worker = max(1.0, self._rate * constants.AUTOSCALE_TARGET_LATENCY)
+            wanted = int(math.ceil(depth / per_worker))
+        wanted = max(self._min_workers, min(self._max_workers, wanted))
+
+        if wanted > active:
+            self._idle_since = None
+            for i in range(wanted - active):
+                self._start_worker()
+            logger.info("Scaled %s worker pool up to %d workers (queue depth: %d)" \
+                % (self._name, wanted, depth))
+
+        elif wanted < active and depth == 0:
+            if self._idle_since is None:
+                self._idle_since = now
+            elif now - self._idle_since >= constants.AUTOSCALE_IDLE_TIMEOUT:
+                # retire one worker at a time
+                self._queue.put(None)
+                self._pills += 1
+                self._idle_since = now
+                logger.info("Retiring idle %s worker (%d left)" % (self._name, active - 1))
+
+        else:
+            self._idle_since = None
+
+    # ------------------------------------------------------------------------
+    #
+    def _start_worker(self):
+        worker = self._factory(self._next_wid, self._progress)
+        self._next_wid += 1
+        worker.start()
+        self._workers.append(worker)
+
+    # ------------------------------------------------------------------------
+    #
+    def _reap(self):
+        # Called with the lock held. Workers only terminate after they
+        # have taken a pill (or crashed).
+        alive = []
+        for worker in self._workers:
+            if worker.is_alive():
+                alive.append(worker)
+            elif self._pills > 0:
+                self._pills -= 1
+            else:
+                logger.warning("A %s worker died unexpectedly." % self._name)
+        self._workers = alive